@@ -2,13 +2,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import socket
+import select
 import struct
 import binascii
 import string
 import re
 import datetime
+import itertools
+import collections
 import time
 import crcmod
+import huffman
+import metrics
+import profiler
 
 class ax25udp:
 
@@ -108,12 +114,44 @@ class ax25udp:
 	L2_MASK_LAST	= 0x01
 	L2_MASK_POLL	= 0x10	# also final bit
 
+	L2_PID_TEXT	= 0xF0	# no layer 3, plain text
+	L2_PID_COMP	= 0xF1	# huffman compressed text of this node, see huffman.py
+
 
 	# Frames
 	L2_MAX_FRAME	= -1	# max frames, without ack
-				# set to -1 is unlimited,
+				# set to -1 is the most modulo 8 allows (7),
 				# frames send with delay from L2_FRAME_DELAY
-	L2_FRAME_DELAY	= 0.03	# some delay between packets
+	L2_FRAME_DELAY	= 0.03	# some delay between packets, of all sessions
+
+	# Transmit Arbiter, output of all sessions is interleaved by deficit round robin,
+	# short answers and prompts are sent before bulk output (iterators, long texts)
+	TX_QUANTUM	= 256	# bytes per round and weight, at least one frame
+	TX_WEIGHT	= 1	# default weight of a session, can be set with callback option
+	TX_WEIGHTS	= {}	# weight by call or call-ssid of the peer, e.g. { "DB0XYZ": 4 }
+	TX_INTERACTIVE	= 512	# max length of a string output, that is not bulk
+
+	# Timers
+	L2_T1		= 10	# seconds to wait for answer of a keepalive probe
+	L2_T3		= 180	# seconds of idle link, before it is probed
+	L2_N2		= 3	# unanswered probes, before link is dropped
+	L2_TICK		= 1.0	# resolution of timers in listen loop
+
+	# Link Parameters, defaults for each connection,
+	# N1 (L2_INFOLEN), k (L2_MAX_FRAME), T1 and N2 can be negotiated with XID
+	L2_N1_RX	= 256	# max info length we accept from peer
+	L2_PACLEN_MIN	= 32	# smallest info length of adaptive frame size
+	L2_ADAPT_CLEAN	= 16	# frames acked without retransmission, before frame size grows
+
+	# XID Parameters (AX.25 2.2)
+	XID_FI		= 0x82	# format indicator
+	XID_GI		= 0x80	# group identifier
+	XID_PI_N1_TX	= 5	# I field length transmit, in bits
+	XID_PI_N1_RX	= 6	# I field length receive, in bits
+	XID_PI_K_TX	= 7	# window size transmit
+	XID_PI_K_RX	= 8	# window size receive
+	XID_PI_T1	= 9	# acknowledge timer, in ms
+	XID_PI_N2	= 10	# retries
 
 	# Program Info
 	P_VERSION	= "0.2"
@@ -136,13 +174,38 @@ class ax25udp:
 	# Connection Masks
 	CON_MASK_CMD		= 0x06
 
-	# build connections id
+	# Connection Limits
+	CON_MAX			= 64	# max sessions, least recently used is dropped
+	CON_TX_MAX		= 16384	# max bytes of pending output per session
+	CON_TX_SHED		= "\r*** Output truncated ***\r"
+
+	# Duplicate Filter, copies of a frame (several digipeaters, udp) are dropped
+	DUP_WINDOW		= 1.0	# seconds a frame is remembered, 0 disables the filter
+	DUP_MAX			= 256	# max remembered frames
+	duplicates		= 0	# count of dropped frames
+
+	# Metrics
+	metrics = metrics.registry
+	profiler = profiler.registry
+
+	# Frame Capture, see capture.Capture
+	capture = None
+
+	# Compression of output, enabled per connection
+	huffman = huffman.Huffman()
+
+	# called with the connection id when a session ends, see listen()
+	close_callback = None
+
+	# build connections id: ((local call, ssid), (remote call, ssid))
 	def conid(self, packet, rx = True):
 		if rx:
+			( local_call, local_ssid, last ) = self.parseAX25call(packet, 0)
 			( con_call, con_ssid, last ) = self.parseAX25call(packet, 7)
 		else:
+			( local_call, local_ssid, last ) = self.parseAX25call(packet, 7)
 	                ( con_call, con_ssid, last ) = self.parseAX25call(packet, 0)
-		return (con_call, con_ssid)
+		return ((local_call, local_ssid), (con_call, con_ssid))
 
 	# create connection entry
 	def conmk(self, conid):
@@ -151,13 +214,68 @@ class ax25udp:
 			self.connections[conid]["tx_seq"] = 0
 			self.connections[conid]["rx_seq"] = 0
 			self.connections[conid]["tx_queue"] = []
+			self.connections[conid]["tx_source"] = None
+			self.connections[conid]["tx_buffer"] = ""
+			self.connections[conid]["tx_queued"] = 0
 			self.connections[conid]["prompt"] = False
-
-	# remove connection entry
+			self.connections[conid]["addr"] = None
+			self.connections[conid]["sock"] = None
+			self.connections[conid]["last"] = time.time()
+			self.connections[conid]["probes"] = 0
+			self.connections[conid]["probe_time"] = 0
+			self.connections[conid]["n1"] = self.L2_INFOLEN
+			self.connections[conid]["k"] = self.L2_MAX_FRAME
+			self.connections[conid]["t1"] = self.L2_T1
+			self.connections[conid]["n2"] = self.L2_N2
+			self.connections[conid]["paclen"] = self.L2_INFOLEN
+			self.connections[conid]["unacked"] = []
+			self.connections[conid]["retries"] = 0
+			self.connections[conid]["clean"] = 0
+			self.connections[conid]["last_tx"] = 0
+			self.connections[conid]["compress"] = False
+			self.connections[conid]["opts"] = {}
+			self.connections[conid]["bulk"] = False
+			self.connections[conid]["weight"] = self.TX_WEIGHT
+			self.connections[conid]["deficit"] = 0
+			self.connections[conid]["cmd_time"] = 0
+			self.connections[conid]["cmd_pull"] = 0.0
+
+	# remove connection entry, an ended session is reported to close_callback
 	def conrm(self, conid):
 		if conid in self.connections:
+			if (self.conupd(conid) & self.CON_MASK_CMD) > 0 and self.close_callback != None:
+				self.close_callback(conid)
 			del self.connections[conid]
 
+	# drop least recently used session, if table is full
+	def conevict(self, conid):
+		active = [ c for c in self.connections if c != conid and (self.conupd(c) & self.CON_MASK_CMD) > 0 ]
+		if len(active) < self.CON_MAX:
+			return
+		oldest = min(active, key = lambda c: self.connections[c]["last"])
+		self.metrics.inc("ax25_sessions_dropped_total", { "reason": "lru" })
+		self.disconnect(self.connections[oldest]["addr"], oldest)
+
+	# weight of a new session from TX_WEIGHTS, call-ssid before call
+	def conweight(self, conid):
+		call = self.connections[conid]["src_call"].upper()
+		ssid = self.connections[conid]["src_ssid"]
+		weight = self.TX_WEIGHTS.get(call + "-" + str(ssid), self.TX_WEIGHTS.get(call, self.TX_WEIGHT))
+		self.connections[conid]["weight"] = max(1, int(weight))
+
+	# apply pending session options from callback
+	def conopt(self, conid):
+		opts = self.connections[conid]["opts"]
+		if "compress" in opts:
+			self.connections[conid]["compress"] = opts["compress"]
+		if "weight" in opts:
+			self.connections[conid]["weight"] = max(1, int(opts["weight"]))
+		# all output of the command is sent, time spent producing
+		# streamed output is render time of the command, not transmit
+		if "cmd" in opts:
+			self.profiler.phase(opts["cmd"], "transmit", time.time() - self.connections[conid]["cmd_time"] - self.connections[conid]["cmd_pull"])
+		self.connections[conid]["opts"] = {}
+
 	# update connection state
 	def conupd(self, conid, state = None):
 		if state != None:
@@ -176,6 +294,7 @@ class ax25udp:
 
 	# decode received packet
 	def decode(self, packet, rx = False):
+		start = self.metrics.clock()
 		# get con and create connection
 		conid = self.conid(packet, rx = rx)
 		self.conmk(conid)
@@ -213,9 +332,11 @@ class ax25udp:
 		# reset some variables
 		self.connections[conid]["pid"] = ""
 		self.connections[conid]["info"] = ""
+		self.connections[conid]["xid"] = ""
+		self.connections[conid]["nr"] = None
 
-		# Received Frame is I Frame, try to get info field
-		if self.connections[conid]["ctrl"] == "I":
+		# Received Frame is I or UI Frame, try to get info field
+		if self.connections[conid]["ctrl"] in [ "I", "UI" ]:
 			# next is pid, decode
 			self.connections[conid]["pid"] = self.parseAX25pid(packet[0:1])
 			# discard pid field
@@ -245,9 +366,61 @@ class ax25udp:
 
 		(byte,) = struct.unpack("<B", ctrl)
 
+		# I and S Frames carry the receive sequence of the peer
+		if self.connections[conid]["ctrl"] == "I" or byte & 0x03 == 0x01:
+			self.connections[conid]["nr"] = (byte>>5 & 0x07)
+
+		# XID Frame, info field follows control field directly
+		if self.connections[conid]["ctrl"] == "XID":
+			self.connections[conid]["xid"] = packet[:-2]
+
+		self.metrics.observe("ax25_decode_seconds", start)
+		self.metrics.inc("ax25_frames_rx_total", { "type": self.connections[conid]["ctrl"] })
 		return conid
 
 
+	# check if the same frame was received within DUP_WINDOW, the key is
+	# dst + src call/ssid, control field and info without via path and crc,
+	# so copies from other digipeaters match too;
+	# S frames repeat on every 8th ack and are harmless twice, they always pass,
+	# U frames but UI (SABM, DISC, ...) set up or end a link, they always pass
+	# and forget the frames of the link, so a new session starts clean
+	def duplicate(self, packet):
+		if self.DUP_WINDOW <= 0 or len(packet) < self.L2_ADDR + 3:
+			return False
+		now = time.time()
+		# forget old frames
+		while len(self.dup_order) > 0 and (now - self.dup_order[0][0] > self.DUP_WINDOW or len(self.dup_order) >= self.DUP_MAX):
+			(stamp, key) = self.dup_order.popleft()
+			if self.dup_seen.get(key) == stamp:
+				del self.dup_seen[key]
+		# skip via path, last address has bit 0 set
+		i = self.L2_IDLEN - 1
+		while i < len(packet) - 3 and not ord(packet[i]) & self.L2_MASK_LAST:
+			i = i + self.L2_IDLEN
+		# no control field and crc after the addresses, left to decode()
+		if i >= len(packet) - 3:
+			return False
+		# only call and ssid, bit 0 (last address) and c/r bits differ between copies
+		addr = packet[0:self.L2_IDLEN - 1] + chr(ord(packet[self.L2_IDLEN - 1]) & 0x1E) \
+			+ packet[self.L2_IDLEN:self.L2_ADDR - 1] + chr(ord(packet[self.L2_ADDR - 1]) & 0x1E)
+		ctrl = ord(packet[i + 1])
+		if ctrl & 0x03 == 0x01:
+			return False
+		if ctrl & 0x03 == 0x03 and ctrl & 0xEF != self.L2_CTRL_UI:
+			for key in [ key for key in self.dup_seen if key[0] == addr ]:
+				del self.dup_seen[key]
+			return False
+		key = (addr, hash(packet[i + 1:-2]))
+		if key in self.dup_seen and now - self.dup_seen[key] <= self.DUP_WINDOW:
+			self.duplicates = self.duplicates + 1
+			self.metrics.inc("ax25_frames_duplicate_total")
+			return True
+		self.dup_seen[key] = now
+		self.dup_order.append((now, key))
+		return False
+
+
 	# parse ax25 control field
 	def parseAX25ctrl(self, bytein):
 		ctrl = ord(bytein)
@@ -273,6 +446,55 @@ class ax25udp:
 		return "UNKNOWN CTRL (" + hex(ctrl) + ")"
 
 
+	# parse xid info field, returns dict: parameter id -> value
+	def parseXID(self, data):
+		params = {}
+		if len(data) < 4 or ord(data[0]) != self.XID_FI or ord(data[1]) != self.XID_GI:
+			return params
+		glen = (ord(data[2]) << 8) | ord(data[3])
+		data = data[4:4+glen]
+		while len(data) >= 2:
+			pi = ord(data[0])
+			pl = ord(data[1])
+			value = 0
+			for c in data[2:2+pl]:
+				value = (value << 8) | ord(c)
+			params[pi] = value
+			data = data[2+pl:]
+		return params
+
+
+	# encode xid info field from list of (parameter id, length, value)
+	def encodeXID(self, params):
+		group = ""
+		for (pi, pl, value) in params:
+			group += chr(pi) + chr(pl)
+			for i in range(pl - 1, -1, -1):
+				group += chr((value >> (8 * i)) & 0xFF)
+		return chr(self.XID_FI) + chr(self.XID_GI) + chr(len(group) >> 8) + chr(len(group) & 0xFF) + group
+
+
+	# take link parameters from xid of peer, returns our answer
+	def negotiate(self, conid):
+		con = self.connections[conid]
+		params = self.parseXID(con["xid"])
+		if self.XID_PI_N1_RX in params:
+			con["n1"] = max(self.L2_PACLEN_MIN, min(self.L2_INFOLEN, params[self.XID_PI_N1_RX] // 8))
+			con["paclen"] = con["n1"]
+		if params.get(self.XID_PI_K_RX, 0) > 0:
+			if con["k"] < 0 or params[self.XID_PI_K_RX] < con["k"]:
+				con["k"] = min(7, params[self.XID_PI_K_RX])
+		if self.XID_PI_T1 in params:
+			con["t1"] = max(self.L2_T1, params[self.XID_PI_T1] / 1000.0)
+		if params.get(self.XID_PI_N2, 0) > 0:
+			con["n2"] = params[self.XID_PI_N2]
+		self.metrics.inc("ax25_xid_total")
+		return self.encodeXID([ (self.XID_PI_N1_RX, 2, self.L2_N1_RX * 8),
+					(self.XID_PI_K_RX, 1, self.window(conid)),
+					(self.XID_PI_T1, 2, int(con["t1"] * 1000)),
+					(self.XID_PI_N2, 1, con["n2"]) ])
+
+
 	# parse ax25 protocol id field
 	def parseAX25pid(self, bytein):
 		pid = ord(bytein)
@@ -289,6 +511,7 @@ class ax25udp:
 		if pid == 0xCD:				return "ARPA Address Resolution"
 		if pid == 0xCE:				return "Flexnet"
 		if pid == 0xCF:				return "NET/ROM"
+		if pid == self.L2_PID_COMP:		return "Huffman compressed text"
 		if pid == 0xF0:				return "No Layer 3"
 		return "UNKNOWN PID"
 
@@ -330,7 +553,8 @@ class ax25udp:
 		return result
 
 	# build a new packet
-	def build(self, conid, ctrl, msg = "", poll = False):
+	def build(self, conid, ctrl, msg = "", poll = False, seq = None):
+		start = self.metrics.clock()
 		packet = self.encode_address(self.connections[conid]["src_call"], self.connections[conid]["src_ssid"])
 		rlen = len(self.connections[conid]["digipeater"])
 		if rlen > 0:
@@ -352,8 +576,10 @@ class ax25udp:
 
 		# if packet is i frame, lets build sequence numbers for it
 		if ctrl == self.L2_CTRL_I:
+			if seq == None:
+				seq = self.connections[conid]["tx_seq"]
 			left = self.connections[conid]["rx_seq"] << 5
-			right = self.connections[conid]["tx_seq"] << 1
+			right = seq << 1
 			packetctrl = (packetctrl | left | right)
 
 		# if packet is rr, lets include sequence number
@@ -366,9 +592,12 @@ class ax25udp:
 
 		packet += struct.pack("<B", packetctrl)
 
-		# I Frame, set Layer 3
-		if ctrl == self.L2_CTRL_I:
-			packet += struct.pack("<B", 0xF0) # no layer 3
+		# I or UI Frame, set Layer 3, compressed frames with their own pid
+		if ctrl == self.L2_CTRL_I or ctrl == self.L2_CTRL_UI:
+			if isinstance(msg, huffman.Compressed):
+				packet += struct.pack("<B", self.L2_PID_COMP)
+			else:
+				packet += struct.pack("<B", self.L2_PID_TEXT) # no layer 3
 
 		# Set info to Frame
 		if msg:
@@ -377,6 +606,7 @@ class ax25udp:
 		# calculate CRC for packet
 		crc = self.calc_crc(packet)
 		self.connections[conid]["packet_tx"] = packet + crc
+		self.metrics.observe("ax25_build_seconds", start)
 		return packet + crc
 
 
@@ -386,7 +616,48 @@ class ax25udp:
 		self.my_call = mycall
 		self.my_ssid = myssid
 	        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		# all bound sockets and local calls, first ones are from here
+		self.ports = [ (self.sock, (host, port)) ]
+		self.calls = [ (mycall, myssid) ]
+		# own connection table, not shared with other instances
+		self.connections = {}
 		self.x25_crc_func = crcmod.predefined.mkCrcFun('x-25')
+		# recently received frames: hash -> time, and hashes in order of arrival
+		self.dup_seen = {}
+		self.dup_order = collections.deque()
+		# sessions with output for the transmit arbiter, next time a frame may be sent
+		self.tx_active = collections.deque()
+		self.tx_next = 0
+		# text for sessions from other threads, see push()
+		self.pushed = collections.deque()
+		self.metrics.gauge("ax25_sessions", self.sessions)
+		self.metrics.gauge("ax25_tx_pending_sessions", self.tx_pending)
+		self.metrics.gauge("ax25_tx_buffer_bytes", self.tx_buffered)
+
+
+	# serve another udp port with the same engine
+	def add_port(self, host, port):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.ports.append((sock, (host, port)))
+		return sock
+
+	# accept connections for another callsign/ssid
+	def add_call(self, call, ssid):
+		if not (call, ssid) in self.calls:
+			self.calls.append((call, ssid))
+
+
+	# count of connections in command state
+	def sessions(self):
+		return len([ c for c in list(self.connections.values()) if c.get("state", self.CON_STATE_INVALID) & self.CON_MASK_CMD ])
+
+	# count of sessions with output not sent yet, queued, buffered or still produced
+	def tx_pending(self):
+		return len([ c for c in list(self.connections.values()) if c.get("tx_queue") or c.get("tx_buffer") or c.get("tx_source") != None ])
+
+	# bytes of output taken from the sources, but not sent yet
+	def tx_buffered(self):
+		return sum([ len(c.get("tx_buffer", "")) + sum([ len(f) for f in c.get("tx_queue", []) ]) for c in list(self.connections.values()) ])
 
 
 	def swap16(self,x):
@@ -399,11 +670,27 @@ class ax25udp:
 		return self.swap16(c)
 
 
-	def send(self, addr, conid, ctrl, msg = "", poll = False):
-		# build new packet and send it to socket
-		self.sock.sendto(self.build(conid, ctrl, msg, poll), addr)
+	def send(self, addr, conid, ctrl, msg = "", poll = False, seq = None):
+		# build new packet and send it to socket,
+		# with seq set, an already sent i frame is repeated
+		packet = self.build(conid, ctrl, msg, poll, seq)
+		sock = self.connections[conid]["sock"]
+		if sock == None:
+			sock = self.sock
+		sock.sendto(packet, addr)
+		if self.capture:
+			self.capture.write(self.capture.DIR_TX, addr, packet)
+		if self.metrics.enabled:
+			self.metrics.inc("ax25_frames_tx_total", { "type": self.parseAX25ctrl(chr(ctrl)) })
 		# if packet is i frame, we have to increase our counter
 		if ctrl == self.L2_CTRL_I:
+			self.connections[conid]["last_tx"] = time.time()
+			if seq != None:
+				return
+			# keep frame until peer acknowledges it, modulo 8 allows 7 outstanding
+			unacked = [ u for u in self.connections[conid]["unacked"] if u[0] != self.connections[conid]["tx_seq"] ]
+			unacked.append((self.connections[conid]["tx_seq"], msg))
+			self.connections[conid]["unacked"] = unacked[-7:]
 			# increase tx sequence
 			if self.connections[conid]["tx_seq"] < 7:
 				# max counter is 7, so lets do +1
@@ -413,10 +700,56 @@ class ax25udp:
 				self.connections[conid]["tx_seq"] = 0
 
 
+	# window k of connection, modulo 8 allows 7 outstanding i frames
+	def window(self, conid):
+		k = self.connections[conid]["k"]
+		if k < 0 or k > 7:
+			return 7
+		return k
+
+
+	# peer received all i frames before nr
+	def ack(self, conid, nr):
+		con = self.connections[conid]
+		if len(con["unacked"]) < 1:
+			return
+		# only V(A) <= nr <= V(S) is valid, others are e.g. late copies
+		va = con["unacked"][0][0]
+		if (nr - va) % 8 > (con["tx_seq"] - va) % 8:
+			return
+		acked = 0
+		while len(con["unacked"]) > 0 and con["unacked"][0][0] != nr:
+			con["unacked"].pop(0)
+			acked = acked + 1
+		if acked < 1:
+			return
+		con["retries"] = 0
+		con["clean"] = con["clean"] + acked
+		# clean link, grow frame size again
+		if con["clean"] >= self.L2_ADAPT_CLEAN and con["paclen"] < con["n1"]:
+			con["paclen"] = min(con["n1"], con["paclen"] + max(16, con["paclen"] // 4))
+			con["clean"] = 0
+
+
+	# repeat unacknowledged i frames (all, or only nr) and shrink frame size
+	def retransmit(self, addr, conid, nr = None):
+		con = self.connections[conid]
+		con["clean"] = 0
+		con["paclen"] = max(self.L2_PACLEN_MIN, con["paclen"] // 2)
+		for (seq, info) in list(con["unacked"]):
+			if nr != None and seq != nr:
+				continue
+			self.metrics.inc("ax25_retransmits_total")
+			self.send(addr, conid, self.L2_CTRL_I, info, seq = seq)
+
+
 	def prompt(self, addr, conid):
 		# build prompt for user interaction
 		if not self.connections[conid]["prompt"]:
-			self.connections[conid]["tx_queue"].append(self.connections[conid]["src_call"] + " de " + self.connections[conid]["dst_call"] + "-" + str(self.connections[conid]["dst_ssid"]) + "> ")
+			prompt = self.connections[conid]["src_call"] + " de " + self.connections[conid]["dst_call"] + "-" + str(self.connections[conid]["dst_ssid"]) + "> "
+			if self.connections[conid]["compress"]:
+				prompt = self.huffman.compress(prompt)
+			self.connections[conid]["tx_queue"].append(prompt)
 			self.connections[conid]["prompt"] = True
 
 	def disconnect(self, addr, conid):
@@ -425,39 +758,293 @@ class ax25udp:
 		self.conrm(conid)
 
 
+	# add output to tx source, output can be string or iterator of strings
+	def output(self, conid, tosend):
+		bulk = self.connections[conid]["tx_source"] != None and self.connections[conid]["bulk"]
+		if isinstance(tosend, str):
+			self.connections[conid]["bulk"] = bulk or len(tosend) > self.TX_INTERACTIVE
+			tosend = self.queue(conid, tosend)
+		else:
+			self.connections[conid]["bulk"] = True
+		if self.connections[conid]["tx_source"] != None:
+			tosend = itertools.chain(self.connections[conid]["tx_source"], tosend)
+		self.connections[conid]["tx_source"] = iter(tosend)
+		# new output gets its own prompt, even if the last one is not finished yet
+		self.connections[conid]["prompt"] = False
+
+
+	# count text waiting in tx source, shed it above CON_TX_MAX bytes,
+	# iterators produce their text only when pulled and are capped there
+	def queue(self, conid, txt):
+		queued = self.connections[conid]["tx_queued"]
+		if queued + len(txt) > self.CON_TX_MAX:
+			self.metrics.inc("ax25_output_truncated_total")
+			if queued >= self.CON_TX_MAX:
+				return []
+			txt = txt[0:self.CON_TX_MAX - queued] + self.CON_TX_SHED
+		self.connections[conid]["tx_queued"] = queued + len(txt)
+		return self.dequeue(conid, txt)
+
+	def dequeue(self, conid, txt):
+		self.connections[conid]["tx_queued"] -= len(txt)
+		yield txt
+
+
+	# fill tx queue with the next frame, output is only pulled from source
+	# if a frame is needed, so a slow producer is throttled by the link
+	def pull(self, addr, conid):
+		if len(self.connections[conid]["tx_queue"]) > 0:
+			return
+		buf = self.connections[conid]["tx_buffer"]
+		paclen = self.connections[conid]["paclen"]
+		want = paclen
+		if self.connections[conid]["compress"]:
+			want = self.huffman.MAXLEN
+		while self.connections[conid]["tx_source"] != None and len(buf) < want:
+			start = self.profiler.clock()
+			try:
+				buf += next(self.connections[conid]["tx_source"])
+			except StopIteration:
+				self.connections[conid]["tx_source"] = None
+			self.connections[conid]["cmd_pull"] += self.profiler.clock() - start
+		# shed output, if too much is pending for this session
+		if len(buf) > self.CON_TX_MAX:
+			self.metrics.inc("ax25_output_truncated_total")
+			buf = buf[0:self.CON_TX_MAX] + self.CON_TX_SHED
+			self.connections[conid]["tx_source"] = None
+			self.connections[conid]["tx_queued"] = 0
+		if len(buf) > 0:
+			if self.connections[conid]["compress"]:
+				(frame, n) = self.huffman.frame(buf, paclen)
+				self.metrics.inc("ax25_compress_bytes_total", { "type": "raw" }, n)
+				self.metrics.inc("ax25_compress_bytes_total", { "type": "compressed" }, len(frame))
+			else:
+				(frame, n) = (buf[0:paclen], paclen)
+			self.connections[conid]["tx_queue"].append(frame)
+			self.connections[conid]["tx_buffer"] = buf[n:]
+			return
+		self.connections[conid]["tx_buffer"] = ""
+		# output complete, finish with prompt
+		self.prompt(addr, conid)
+
+
+	# send text to a session (connection id as passed to the callback),
+	# can be called from any thread, it is sent from the listen loop within L2_TICK
+	def push(self, conid, msg):
+		self.pushed.append((conid, msg))
+
+	# hand pushed text over to the sessions, ended sessions are skipped
+	def deliver(self):
+		while len(self.pushed) > 0:
+			(conid, msg) = self.pushed.popleft()
+			if not msg.endswith('\r'):
+				msg = msg + '\r'
+			if not conid in self.connections or (self.conupd(conid) & self.CON_MASK_CMD) < 1:
+				continue
+			self.output(conid, msg)
+			self.send_queue(self.connections[conid]["addr"], conid)
+
+
+	# hand connection over to the transmit arbiter, frames are sent from listen loop
 	def send_queue(self, addr, conid):
-		if (self.conupd(conid) & self.CON_MASK_CMD) > 0:
-			self.prompt(addr, conid)
-			i = 0
-			while(len(self.connections[conid]["tx_queue"]) > 0 and (self.L2_MAX_FRAME < 0 or i < self.L2_MAX_FRAME)):
-				self.conupd(conid, self.CON_STATE_ESTABLISHED)
-				self.send(addr, conid, self.L2_CTRL_I, self.connections[conid]["tx_queue"].pop(0))
-				i = i + 1
-				time.sleep(self.L2_FRAME_DELAY)
-			if len(self.connections[conid]["tx_queue"]) < 1 and self.conupd(conid) == self.CON_STATE_ESTABLISHED:
-				self.connections[conid]["prompt"] = False
-				self.conupd(conid, self.CON_STATE_WAIT)
+		if (self.conupd(conid) & self.CON_MASK_CMD) > 0 and not conid in self.tx_active:
+			self.tx_active.append(conid)
 
 
-	def listen(self, callback = None):
-		# lets bind our socket
-		self.sock.bind((self.host, self.port))
+	# check if connection can send its next frame (window k not full),
+	# if all output is sent, the connection waits for the next command
+	def pending(self, conid):
+		con = self.connections[conid]
+		if (self.conupd(conid) & self.CON_MASK_CMD) < 1:
+			return False
+		if len(con["unacked"]) >= self.window(conid):
+			return False
+		self.pull(con["addr"], conid)
+		if len(con["tx_queue"]) > 0:
+			return True
+		self.finish(conid)
+		return False
+
+
+	# output and prompt are sent, connection waits for the next command
+	def finish(self, conid):
+		con = self.connections[conid]
+		if len(con["tx_queue"]) > 0 or con["tx_source"] != None or len(con["tx_buffer"]) > 0 or not con["prompt"]:
+			return False
+		if self.conupd(conid) != self.CON_STATE_ESTABLISHED:
+			return False
+		con["prompt"] = False
+		self.conupd(conid, self.CON_STATE_WAIT)
+		# options from callback take effect after its output and prompt
+		self.conopt(conid)
+		return True
+
+
+	# send one frame of the active sessions, interactive ones first,
+	# returns False if there was nothing to send
+	def arbiter(self):
+		return self.arbitrate(False) or self.arbitrate(True)
+
+	# deficit round robin over sessions of one class (bulk or not),
+	# a session sends while its deficit covers the next frame
+	def arbitrate(self, bulk):
+		rr = self.tx_active
+		for i in range(2 * len(rr)):
+			if len(rr) < 1:
+				break
+			conid = rr[0]
+			# nothing to send, or window full: session leaves until next ack/command
+			if not conid in self.connections or not self.pending(conid):
+				if conid in self.connections:
+					self.connections[conid]["deficit"] = 0
+				rr.popleft()
+				continue
+			con = self.connections[conid]
+			if bulk != (con["bulk"] and (con["tx_source"] != None or len(con["tx_buffer"]) > 0)):
+				rr.rotate(-1)
+				continue
+			frame = con["tx_queue"][0]
+			if con["deficit"] < len(frame):
+				con["deficit"] = con["deficit"] + self.TX_QUANTUM * con["weight"]
+				rr.rotate(-1)
+				continue
+			con["deficit"] = con["deficit"] - len(frame)
+			self.conupd(conid, self.CON_STATE_ESTABLISHED)
+			self.send(con["addr"], conid, self.L2_CTRL_I, con["tx_queue"].pop(0))
+			# finish at once, the next command may arrive before the next round
+			if self.finish(conid):
+				con["deficit"] = 0
+				rr.popleft()
+			return True
+		return False
+
+
+	# probe idle links, drop dead links and stale entries
+	def timers(self):
+		now = time.time()
+		for conid in list(self.connections.keys()):
+			con = self.connections[conid]
+			# entries without session, e.g. from stray frames
+			if (self.conupd(conid) & self.CON_MASK_CMD) < 1:
+				if now - con["last"] > self.L2_T1:
+					self.conrm(conid)
+				continue
+			# i frames not acknowledged within t1, repeat them
+			if len(con["unacked"]) > 0 and now - con["last_tx"] >= con["t1"]:
+				if con["retries"] >= con["n2"]:
+					self.metrics.inc("ax25_sessions_dropped_total", { "reason": "retries" })
+					self.disconnect(con["addr"], conid)
+					continue
+				con["retries"] = con["retries"] + 1
+				self.retransmit(con["addr"], conid)
+				continue
+			if con["probes"] < 1:
+				if now - con["last"] >= self.L2_T3:
+					con["probes"] = 1
+					con["probe_time"] = now
+					self.send(con["addr"], conid, self.L2_CTRL_RR, poll = True)
+				continue
+			if now - con["probe_time"] < con["t1"]:
+				continue
+			if con["probes"] >= con["n2"]:
+				self.metrics.inc("ax25_sessions_dropped_total", { "reason": "idle" })
+				self.disconnect(con["addr"], conid)
+				continue
+			con["probes"] = con["probes"] + 1
+			con["probe_time"] = now
+			self.send(con["addr"], conid, self.L2_CTRL_RR, poll = True)
+
+
+	def listen(self, callback = None, ui_callback = None, close_callback = None):
+		self.close_callback = close_callback
+		# lets bind our sockets
+		for (sock, bind) in self.ports:
+			sock.bind(bind)
+		socks = [ sock for (sock, bind) in self.ports ]
+		ready = []
+		tick = time.time()
 
 		# run listening loop forever
 		while True:
-			# try to receive data from socket
-			data, addr = self.sock.recvfrom(2048)
+			# run timers
+			if time.time() - tick >= self.L2_TICK:
+				tick = time.time()
+				self.timers()
+
+			# send next frame of the active sessions
+			if len(self.pushed) > 0:
+				self.deliver()
+			now = time.time()
+			if now >= self.tx_next and len(self.tx_active) > 0:
+				if self.arbiter():
+					self.tx_next = now + self.L2_FRAME_DELAY
+
+			# wait for data on any socket, one packet per loop,
+			# but not longer than the next frame is due
+			if len(ready) < 1:
+				timeout = self.L2_TICK
+				if len(self.tx_active) > 0:
+					timeout = max(0, min(timeout, self.tx_next - time.time()))
+				(ready, w, x) = select.select(socks, [], [], timeout)
+				if len(ready) < 1:
+					continue
+			sock = ready.pop(0)
+			data, addr = sock.recvfrom(2048)
+			if self.capture:
+				self.capture.write(self.capture.DIR_RX, addr, data)
+			# drop copies of the same frame
+			if self.duplicate(data):
+				continue
 			# parse incoming packet and get connection id
 			conid = self.decode(data, rx = True)
 
 			# incoming packet is not for me ;-(
-			if self.connections[conid]["dst_call"] != self.my_call or self.connections[conid]["dst_ssid"] != self.my_ssid:
+			if not (self.connections[conid]["dst_call"], self.connections[conid]["dst_ssid"]) in self.calls:
 				self.conrm(conid)
 				continue
 
+			# any frame from peer answers our keepalive probes
+			probing = self.connections[conid]["probes"] > 0
+			self.connections[conid]["probes"] = 0
+			self.connections[conid]["last"] = time.time()
+			self.connections[conid]["addr"] = addr
+			self.connections[conid]["sock"] = sock
+
+			# peer acknowledges our i frames
+			if self.connections[conid]["nr"] != None:
+				self.ack(conid, self.connections[conid]["nr"])
+
+			# incoming packet is parameter negotiation, answer with our parameters
+			if self.connections[conid]["ctrl"] == "XID":
+				self.send(addr, conid, self.L2_CTRL_XID, self.negotiate(conid), poll = self.connections[conid]["poll"] > 0)
+				continue
+
 			# incoming packet is connection request
 			if self.connections[conid]["ctrl"] == "SABM":
 				self.conmk(conid)
+				self.conevict(conid)
+				# connect again without disc, the old session is over
+				if (self.conupd(conid) & self.CON_MASK_CMD) > 0 and self.close_callback != None:
+					self.close_callback(conid)
+				# reset link and session, negotiated parameters are kept
+				self.connections[conid]["tx_seq"] = 0
+				self.connections[conid]["rx_seq"] = 0
+				self.connections[conid]["unacked"] = []
+				self.connections[conid]["retries"] = 0
+				self.connections[conid]["clean"] = 0
+				self.connections[conid]["paclen"] = self.connections[conid]["n1"]
+				self.connections[conid]["tx_queue"] = []
+				self.connections[conid]["tx_source"] = None
+				self.connections[conid]["tx_buffer"] = ""
+				self.connections[conid]["tx_queued"] = 0
+				self.connections[conid]["prompt"] = False
+				self.connections[conid]["compress"] = False
+				self.connections[conid]["opts"] = {}
+				self.connections[conid]["bulk"] = False
+				self.connections[conid]["deficit"] = 0
+				self.connections[conid]["cmd_time"] = 0
+				self.connections[conid]["cmd_pull"] = 0.0
+				self.conweight(conid)
 				self.conupd(conid, self.CON_STATE_NEW)
 				self.send(addr, conid, self.L2_CTRL_UA, "", poll = True)
 				# mark connections as established
@@ -467,6 +1054,17 @@ class ax25udp:
 					self.connections[conid]["tx_queue"].append(self.banner)
 				continue
 
+			# incoming packet is unnumbered info, no session needed
+			# ui_callback have to return a string, sent back as UI frame if not empty
+			if self.connections[conid]["ctrl"] == "UI":
+				if not ui_callback == None and self.connections[conid]["info"]:
+					ack = ui_callback(self.connections[conid]["src_call"], self.connections[conid]["info"])
+					if ack:
+						self.send(addr, conid, self.L2_CTRL_UI, ack)
+				if (self.conupd(conid) & self.CON_MASK_CMD) < 1:
+					self.conrm(conid)
+				continue
+
 			# incoming packet is info frame
 			if self.connections[conid]["ctrl"] == "I":
 				# if no connection established, send disc
@@ -479,26 +1077,40 @@ class ax25udp:
 				self.conupd(conid, self.CON_STATE_ESTABLISHED)
 
 				# if callback is set, run into more functions
-				# callback have to return (disc, tosend):
+				# callback have to return (disc, tosend) or (disc, tosend, opts):
 				# disc   = bool, Should connection be disconnected? Maybe request from user?
-				# tosend = string, should we send an output to connected user?
+				# tosend = string or iterator of strings, should we send an output to connected user?
+				# opts   = dict, session options, set after tosend and prompt are sent:
+				#          compress = bool, huffman compression of output
+				#          weight   = int, share of the transmit arbiter
+				#          cmd      = string, command name for timing of transmission
+				# with close_callback, callback gets the connection id as third argument,
+				# close_callback(conid) is called once the session ends (disc, timeout, eviction)
 				if not callback == None:
 					self.send(addr, conid, self.L2_CTRL_I, "")
-					(disc, tosend) = callback(self.connections[conid]["src_call"], self.connections[conid]["info"])
+					if self.close_callback != None:
+						res = callback(self.connections[conid]["src_call"], self.connections[conid]["info"], conid)
+					else:
+						res = callback(self.connections[conid]["src_call"], self.connections[conid]["info"])
+					(disc, tosend) = res[0:2]
+					if len(res) > 2:
+						self.connections[conid]["opts"].update(res[2])
+						self.connections[conid]["cmd_time"] = time.time()
+						self.connections[conid]["cmd_pull"] = 0.0
 					# if disconnect request received, send DISC
 					if disc:
 						self.disconnect(addr, conid)
 						continue
 					# if we have to send output, make sure that newline is set,
-					# buffer the string and send i frame packet
+					# hand it over to the tx source and send i frame packets,
+					# iterators are framed while they are produced
 					if tosend:
-						if tosend[:-2] != '\r':
-							tosend = tosend + '\r'
-						while len(tosend)>0:
-							plen = len(tosend)
-							if len(tosend) > self.L2_INFOLEN:	plen = self.L2_INFOLEN
-							self.connections[conid]["tx_queue"].append(tosend[0:plen])
-							tosend = tosend[plen:]
+						if isinstance(tosend, str):
+							if tosend[:-2] != '\r':
+								tosend = tosend + '\r'
+						else:
+							tosend = itertools.chain(tosend, [ '\r' ])
+						self.output(conid, tosend)
 						self.send_queue(addr, conid)
 						continue
 
@@ -517,15 +1129,26 @@ class ax25udp:
 				self.send_queue(addr, conid)
 				continue
 
-			# keep alive
-			if self.connections[conid]["ctrl"] == "RR" and (self.conupd(conid) & self.CON_MASK_CMD) > 0 and self.connections[conid]["poll"] > 0:
+			# keep alive, but do not answer the response to our own probe
+			if self.connections[conid]["ctrl"] == "RR" and (self.conupd(conid) & self.CON_MASK_CMD) > 0 and self.connections[conid]["poll"] > 0 and not probing:
 				poll = False
 				if self.connections[conid]["poll"] > 0: 	poll = True
 				self.send(addr, conid, self.L2_CTRL_RR, poll = poll)
 				continue
 
-			# peer rejects packet
+			# peer rejects i frames, repeat them (SREJ: only the one requested)
+			if "REJ" in self.connections[conid]["ctrl"] and (self.conupd(conid) & self.CON_MASK_CMD) > 0:
+				self.metrics.inc("ax25_retransmit_requests_total", { "type": self.connections[conid]["ctrl"] })
+				if self.connections[conid]["ctrl"] == "SREJ":
+					self.retransmit(addr, conid, self.connections[conid]["nr"])
+				else:
+					self.retransmit(addr, conid)
+				self.send_queue(addr, conid)
+				continue
+
+			# peer rejects frame
 			if "REJ" in self.connections[conid]["ctrl"] or "FRMR" in self.connections[conid]["ctrl"]:
+				self.metrics.inc("ax25_retransmit_requests_total", { "type": self.connections[conid]["ctrl"] })
 				self.disconnect(addr, conid)
 				continue
 
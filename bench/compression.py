@@ -0,0 +1,67 @@
+# byte reduction of huffman compressed output and of the record formats on list commands,
+# rendered by DapNetCLI from the stub api datasets
+#
+# usage: python bench/compression.py [paclen]
+from __future__ import print_function
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ax25udp
+import dapnetcli
+import huffman
+import stubapi
+
+
+class Api:
+
+	def __init__(self, data):
+		self.data = data
+
+	def get_userlist(self):		return self.data["users"]
+	def get_nodelist(self):		return self.data["nodes"]
+	def get_transmitterlist(self):	return self.data["transmitters"]
+	def get_rubriclist(self):	return self.data["rubrics"]
+
+
+def frames(txt, paclen, codec = None):
+	count = 0
+	size = 0
+	while txt:
+		if codec:
+			(data, n) = codec.frame(txt, paclen)
+		else:
+			(data, n) = (txt[0:paclen], paclen)
+		txt = txt[n:]
+		count = count + 1
+		size = size + len(data)
+	return (count, size)
+
+
+def main():
+	paclen = ax25udp.ax25udp.L2_INFOLEN
+	if len(sys.argv) > 1:
+		paclen = int(sys.argv[1])
+	# only the datasets are needed, no server
+	stub = stubapi.StubApi()
+	stub.server.server_close()
+	cli = dapnetcli.DapNetCLI("DB0BEN", "", "")
+	cli.api = Api(stub.data)
+	codec = huffman.Huffman()
+
+	print("paclen %d" % paclen)
+	print("%-21s %8s %8s %8s %8s %7s" % ("command", "bytes", "frames", "comp", "frames", "ratio"))
+	for fmt in cli.settings["format"]:
+		cli.udphandler("DL1NE", "set format " + fmt)
+		for cmd in [ "userlist", "transmitterlist", "rubriclist", "nodelist", "help" ]:
+			if fmt != "text" and not cmd in cli.records:
+				continue
+			res = cli.udphandler("DL1NE", cmd)[1]
+			txt = "".join(res)
+			(f1, b1) = frames(txt, paclen)
+			(f2, b2) = frames(txt, paclen, codec)
+			print("%-21s %8d %8d %8d %8d %6.1f%%" % (cmd + " " + fmt, b1, f1, b2, f2, 100.0 * b2 / b1))
+
+
+if __name__ == "__main__":
+	main()
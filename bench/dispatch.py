@@ -0,0 +1,56 @@
+# micro benchmark: per-line dispatch cost of DapNetCLI.check_input,
+# old linear substring scan + eval against the precomputed prefix table
+#
+# usage: python bench/dispatch.py [loops]
+from __future__ import print_function
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dapnetcli
+
+lines = [ "help", "h", "nodelist", "n", "userlist dl1", "u", "transmitterlist db0",
+	  "t", "rubriclist", "r", "sregion dl-ni", "sr", "semergency yes", "sem",
+	  "set", "exit", "quit", "page dl1ne test", "p dl1ne test", "foobar", "s" ]
+
+
+class Bench(dapnetcli.DapNetCLI):
+
+	# handlers are replaced by no-ops, only dispatch cost is measured
+	def noop(self):
+		pass
+
+	def linear(self, input):
+		words = input.split()
+		count = 0
+		func = ""
+		for cmd in self.commands:
+			if words[0] in cmd:
+				count = count + 1
+				func = cmd
+		if count == 1:
+			eval("self.noop()")
+
+	def compiled(self, input):
+		words = input.split()
+		func = self.resolve(words[0])
+		if func:
+			self.handlers[func]()
+
+
+def main():
+	loops = 20000
+	if len(sys.argv) > 1:
+		loops = int(sys.argv[1])
+	cli = Bench("DB0AAA", "", "")
+	for cmd in cli.commands:
+		cli.handlers[cmd] = cli.noop
+	for name in [ "linear", "compiled" ]:
+		func = getattr(cli, name)
+		t = timeit.timeit(lambda: [ func(l) for l in lines ], number = loops)
+		print("%-10s %8.3f us/line" % (name, t / (loops * len(lines)) * 1e6))
+
+
+if __name__ == "__main__":
+	main()
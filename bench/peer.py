@@ -0,0 +1,161 @@
+# simulated AX.25 peer: opens sessions against a node and runs scripted commands
+from __future__ import print_function
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ax25udp
+import crcmod
+
+
+# frame encoding/decoding of ax25udp, without socket and connection table
+class Codec(ax25udp.ax25udp):
+
+	def __init__(self):
+		self.x25_crc_func = crcmod.predefined.mkCrcFun('x-25')
+
+	def frame(self, dst, dst_ssid, src, src_ssid, ctrl, info = None):
+		packet = self.encode_address(dst, dst_ssid) + self.encode_address(src, src_ssid, final = True)
+		packet += chr(ctrl)
+		if info != None:
+			packet += chr(0xF0) + info
+		return packet + self.calc_crc(packet)
+
+	# returns (ctrl, nr, info) of received frame
+	def parse(self, data):
+		pos = self.L2_ADDR
+		while not ord(data[pos - 1]) & self.L2_MASK_LAST and pos + self.L2_IDLEN < len(data):
+			pos = pos + self.L2_IDLEN
+		ctrl = self.parseAX25ctrl(data[pos])
+		nr = (ord(data[pos]) >> 5) & 0x07
+		info = ""
+		if ctrl in [ "I", "UI" ]:
+			info = data[pos + 2:-2]
+			if ord(data[pos + 1]) == self.L2_PID_COMP:
+				info = self.huffman.decompress(info)
+		return (ctrl, nr, info)
+
+
+codec = Codec()
+
+
+class Session:
+
+	timeout = 5.0		# max wait for a frame in seconds
+	t2 = 0.05		# delay of acknowledge, as AX.25 T2
+
+	def __init__(self, node, node_ssid, addr, call, ssid = 0):
+		self.node = node
+		self.node_ssid = node_ssid
+		self.addr = addr
+		self.call = call
+		self.ssid = ssid
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.settimeout(self.timeout)
+		self.vs = 0
+		self.vr = 0
+		self.unacked = 0
+		self.frames_rx = 0
+		self.bytes_rx = 0
+		self.frames_tx = 0
+		self.latency = []
+
+
+	def send(self, ctrl, info = None):
+		self.sock.sendto(codec.frame(self.node, self.node_ssid, self.call, self.ssid, ctrl, info), self.addr)
+		self.frames_tx = self.frames_tx + 1
+
+
+	def ack(self):
+		self.send(codec.L2_CTRL_RR | (self.vr << 5))
+		self.unacked = 0
+
+
+	def recv(self):
+		while True:
+			if self.unacked < 1:
+				data, addr = self.sock.recvfrom(2048)
+				break
+			# acknowledge i frames, if no more frames follow within t2
+			self.sock.settimeout(self.t2)
+			try:
+				data, addr = self.sock.recvfrom(2048)
+				break
+			except socket.timeout:
+				self.ack()
+			finally:
+				self.sock.settimeout(self.timeout)
+		self.frames_rx = self.frames_rx + 1
+		self.bytes_rx = self.bytes_rx + len(data)
+		(ctrl, nr, info) = codec.parse(data)
+		if ctrl == "I":
+			self.vr = (self.vr + 1) % 8
+			self.unacked = self.unacked + 1
+			if self.unacked >= 7:
+				self.ack()
+		return (ctrl, info)
+
+
+	# wait until frame with given ctrl is received
+	def expect(self, ctrl):
+		while True:
+			(c, info) = self.recv()
+			if c == ctrl:
+				return info
+
+
+	# wait until the prompt is received, returns output
+	def prompt(self):
+		out = ""
+		while True:
+			(c, info) = self.recv()
+			if c == "DISC":
+				return out
+			out += info
+			if c == "I" and info.endswith("> "):
+				return out
+
+
+	# connect and wait for motd, banner and first prompt
+	def connect(self):
+		self.send(codec.L2_CTRL_SABM | codec.L2_MASK_POLL)
+		self.expect("UA")
+		return self.prompt()
+
+
+	# run command, returns output and stores latency until prompt
+	def command(self, txt):
+		start = time.time()
+		self.send(codec.L2_CTRL_I | (self.vr << 5) | (self.vs << 1), txt + "\r")
+		self.vs = (self.vs + 1) % 8
+		out = self.prompt()
+		self.latency.append(time.time() - start)
+		return out
+
+
+	def disconnect(self):
+		self.send(codec.L2_CTRL_DISC | codec.L2_MASK_POLL)
+		try:
+			self.expect("DISC")
+		except socket.timeout:
+			pass
+		self.sock.close()
+
+
+	# page with a single UI frame, returns the UI answer of the node
+	def page_ui(self, dest, txt):
+		start = time.time()
+		self.send(codec.L2_CTRL_UI, "page " + dest + " " + txt + "\r")
+		out = self.expect("UI")
+		self.latency.append(time.time() - start)
+		return out
+
+
+	# full scripted session
+	def run(self, commands):
+		self.connect()
+		for cmd in commands:
+			self.command(cmd)
+		self.disconnect()
@@ -0,0 +1,95 @@
+# replay received frames of a capture file against a node
+#
+# without --target a local node with stub api is started (see run.py),
+# with --compare the answers are checked against the frames sent in the capture
+#
+# usage: python bench/replay.py traffic.cap [--target host:port] [--speed 1.0] [--compare]
+from __future__ import print_function
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import capture
+import run
+
+
+def main():
+	parser = argparse.ArgumentParser(description = "replay ax25udp capture")
+	parser.add_argument("file", help = "capture file")
+	parser.add_argument("--target", default = "", help = "host:port of running node")
+	parser.add_argument("--speed", type = float, default = 1.0, help = "time scale of original gaps, 0 = as fast as possible")
+	parser.add_argument("--wait", type = float, default = 1.0, help = "seconds to wait for answers after last frame")
+	parser.add_argument("--compare", action = "store_true", help = "compare answers with captured frames")
+	parser.add_argument("--out", default = "", help = "write replay traffic to capture file")
+	opts = parser.parse_args()
+
+	records = list(capture.Capture(opts.file).read())
+	rx = [ r for r in records if r[1] == capture.Capture.DIR_RX ]
+	tx = [ r[3] for r in records if r[1] == capture.Capture.DIR_TX ]
+
+	if opts.target:
+		(host, port) = opts.target.split(":")
+		addr = (host, int(port))
+	else:
+		(stub, node, addr, tmp) = run.start_node(run.options([]))
+
+	out = None
+	if opts.out:
+		out = capture.Capture(opts.out, "w")
+
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.settimeout(opts.wait)
+	answers = []
+
+	def receiver():
+		while True:
+			try:
+				data, peer = sock.recvfrom(2048)
+			except socket.timeout:
+				continue
+			except socket.error:
+				return
+			answers.append(data)
+			if out:
+				out.write(out.DIR_RX, peer, data)
+
+	t = threading.Thread(target = receiver)
+	t.daemon = True
+
+	start = time.time()
+	last = None
+	for (stamp, direction, peer, data) in rx:
+		if opts.speed > 0 and last != None:
+			time.sleep((stamp - last) * opts.speed)
+		last = stamp
+		sock.sendto(data, addr)
+		if out:
+			out.write(out.DIR_TX, addr, data)
+		if not t.is_alive():
+			t.start()
+	sent = time.time() - start
+	time.sleep(opts.wait)
+
+	print("frames sent     %d in %.3f s (%.1f/s)" % (len(rx), sent, len(rx) / max(sent, 0.000001)))
+	print("frames received %d (captured: %d)" % (len(answers), len(tx)))
+	if opts.compare:
+		# sessions interleave differently on every run,
+		# so frames are compared per destination (the user) only
+		diff = 0
+		for dst in set([ f[0:7] for f in tx + answers ]):
+			a = [ f for f in tx if f[0:7] == dst ]
+			b = [ f for f in answers if f[0:7] == dst ]
+			for i in range(max(len(a), len(b))):
+				if i >= len(a) or i >= len(b) or a[i] != b[i]:
+					diff = diff + 1
+		print("mismatches      %d" % diff)
+		if diff > 0:
+			sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,183 @@
+# load generator: N concurrent AX.25 sessions against ax25udp.listen + DapNetCLI,
+# backed by the local stub api
+#
+# usage: python bench/run.py --sessions 50 --concurrency 10
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ax25udp
+import capture
+import dapnet
+import dapnetcli
+import peer
+import stubapi
+
+NODE_CALL	= "DB0BEN"
+NODE_SSID	= 3
+
+
+def options(argv = None):
+	parser = argparse.ArgumentParser(description = "ax25udp/DapNetCLI benchmark")
+	parser.add_argument("--sessions", type = int, default = 50, help = "sessions in total")
+	parser.add_argument("--concurrency", type = int, default = 10, help = "concurrent sessions")
+	parser.add_argument("--commands", default = "userlist;transmitterlist db0tx1;rubriclist;page dl1xyz bench",
+			    help = "commands per session, separated by ;")
+	parser.add_argument("--latency", type = float, default = 0.0, help = "stub api latency in seconds")
+	parser.add_argument("--failure", type = float, default = 0.0, help = "stub api failure rate")
+	parser.add_argument("--delay", type = float, default = 0.0, help = "ax25udp L2_FRAME_DELAY")
+	parser.add_argument("--window", type = int, default = -1, help = "ax25udp L2_MAX_FRAME")
+	parser.add_argument("--capture", default = "", help = "write node traffic to capture file")
+	parser.add_argument("--mix", default = "", help = "commands of every second session, e.g. short ones against list output")
+	parser.add_argument("--batch", action = "store_true", help = "send all commands in one line, executed as one batch")
+	parser.add_argument("--ui", action = "store_true", help = "send page commands as single UI frames, without session, others are skipped")
+	opts = parser.parse_args(argv)
+	if opts.ui:
+		if opts.batch:
+			parser.error("--ui sends single frames, it can not be used with --batch")
+		if not [ c for c in opts.commands.split(";") + opts.mix.split(";") if ui_page(c) ]:
+			parser.error("--ui needs at least one command \"page <call> <text>\"")
+	return opts
+
+
+# commands, which can be sent as UI frame
+def ui_page(cmd):
+	words = cmd.split()
+	return len(words) >= 3 and words[0].lower() == "page"
+
+
+def free_port():
+	s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	s.bind(("127.0.0.1", 0))
+	port = s.getsockname()[1]
+	s.close()
+	return port
+
+
+# start stub api, cli and node, returns (stub, node, addr, tmpdir)
+def start_node(opts):
+	tmp = tempfile.mkdtemp(prefix = "dapnet-bench-")
+	dapnet.DapNet.config_file = os.path.join(tmp, "dapnet.ini")
+	stub = stubapi.StubApi().start()
+	stub.latency = opts.latency
+	cli = dapnetcli.DapNetCLI(NODE_CALL, "bench", "bench", api_url = stub.url())
+	cli.udpapi()
+	# failures only while the sessions run, not at startup
+	stub.failure = opts.failure
+	addr = ("127.0.0.1", free_port())
+	node = ax25udp.ax25udp(addr[0], addr[1], NODE_CALL, NODE_SSID)
+	node.L2_FRAME_DELAY = opts.delay
+	node.L2_MAX_FRAME = opts.window
+	node.banner("DAPNET AX25UDP/PY benchmark")
+	cli.push = node.push
+	if opts.capture:
+		node.capture = capture.Capture(opts.capture, "w")
+	node.stopped = None
+	def listen():
+		# e.g. exit() of DapNet, if no api node is left
+		try:
+			node.listen(cli.udphandler, cli.uihandler, cli.closed)
+		except BaseException as e:
+			node.stopped = "%s %s" % (type(e).__name__, e)
+	t = threading.Thread(target = listen)
+	t.daemon = True
+	t.start()
+	time.sleep(0.1)
+	return (stub, node, addr, tmp)
+
+
+def percentile(values, p):
+	if not values:
+		return 0.0
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def main():
+	opts = options()
+	(stub, node, addr, tmp) = start_node(opts)
+	commands = [ c.strip() for c in opts.commands.split(";") if c.strip() ]
+	mix = [ c.strip() for c in opts.mix.split(";") if c.strip() ]
+
+	lock = threading.Lock()
+	pending = list(range(opts.sessions))
+	done = []
+	errors = []
+
+	def worker():
+		while True:
+			with lock:
+				if not pending:
+					return
+				i = pending.pop(0)
+			s = peer.Session(NODE_CALL, NODE_SSID, addr, "BN%04d" % i)
+			s.commands = commands
+			if mix and i % 2 == 1:
+				s.commands = mix
+			if opts.batch:
+				s.commands = [ ";".join(s.commands) ]
+			if opts.ui:
+				s.commands = [ cmd for cmd in s.commands if ui_page(cmd) ]
+			try:
+				if opts.ui:
+					for cmd in s.commands:
+						words = cmd.split(None, 2)
+						s.page_ui(words[1], words[2])
+				else:
+					s.run(s.commands)
+			except Exception as e:
+				with lock:
+					errors.append((s.call, "%s %s" % (type(e).__name__, e)))
+			with lock:
+				done.append(s)
+
+	start = time.time()
+	threads = [ threading.Thread(target = worker) for i in range(opts.concurrency) ]
+	for t in threads:
+		t.daemon = True
+		t.start()
+	for t in threads:
+		t.join()
+	elapsed = time.time() - start
+
+	latency = []
+	bycmd = {}
+	frames_rx = frames_tx = bytes_rx = 0
+	for s in done:
+		latency += s.latency
+		for (cmd, t) in zip(s.commands, s.latency):
+			bycmd.setdefault(cmd.split()[0], []).append(t)
+		frames_rx += s.frames_rx
+		frames_tx += s.frames_tx
+		bytes_rx += s.bytes_rx
+
+	print("sessions        %d (%d failed, %d concurrent)" % (len(done), len(errors), opts.concurrency))
+	print("elapsed         %.3f s" % elapsed)
+	print("sessions/sec    %.2f" % (len(done) / elapsed))
+	print("commands        %d" % len(latency))
+	for p in [ 50, 90, 99 ]:
+		print("latency p%-2d     %.2f ms" % (p, percentile(latency, p) * 1000))
+	print("latency max     %.2f ms" % (max(latency or [ 0 ]) * 1000))
+	for cmd in sorted(bycmd):
+		print("  %-16s p50 %.2f ms, p99 %.2f ms" % (cmd, percentile(bycmd[cmd], 50) * 1000, percentile(bycmd[cmd], 99) * 1000))
+	print("frames node->   %d (%.1f/s, %.1f kB/s)" % (frames_rx, frames_rx / elapsed, bytes_rx / elapsed / 1024))
+	print("frames ->node   %d (%.1f/s)" % (frames_tx, frames_tx / elapsed))
+	print("api requests    %d (%d failed)" % (stub.requests, stub.failed))
+	for (call, error) in errors[0:5]:
+		print("error           %s: %s" % (call, error))
+	if node.stopped:
+		print("node stopped    %s" % node.stopped)
+
+	stub.stop()
+	shutil.rmtree(tmp, ignore_errors = True)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,146 @@
+# local stub of the DAPNET HTTP API, with configurable latency and failures
+#
+# usage: python bench/stubapi.py [port] [latency] [failure rate]
+from __future__ import print_function
+import json
+import random
+import sys
+import threading
+import time
+
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+	from SocketServer import ThreadingMixIn
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+	from socketserver import ThreadingMixIn
+
+
+class Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class StubApi:
+
+	latency = 0.0		# delay per request in seconds
+	failure = 0.0		# rate of requests answered with 500
+
+	# mirrors are more ports with the same data, used as node addresses,
+	# so the failover of DapNet has reachable targets
+	def __init__(self, host = "127.0.0.1", port = 0, users = 400, nodes = 20, transmitters = 150, rubrics = 30, mirrors = 3):
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.failed = 0
+		self.calls = []
+		self.server = Server((host, port), self.handler())
+		self.mirrors = [ Server((host, 0), self.handler()) for i in range(mirrors) ]
+		self.host = host
+		self.port = self.server.server_address[1]
+		self.data = self.dataset(users, nodes, transmitters, rubrics)
+
+
+	# address as used by DapNet(url = ...)
+	def url(self):
+		return self.host + ":" + str(self.port)
+
+	# addresses of the nodes, the mirrors or the stub itself
+	def node_url(self, i):
+		if len(self.mirrors) < 1:
+			return self.url()
+		return self.host + ":" + str(self.mirrors[i % len(self.mirrors)].server_address[1])
+
+
+	# generate datasets, shaped like the real api answers
+	def dataset(self, users, nodes, transmitters, rubrics):
+		rnd = random.Random(transmitters)
+		data = {}
+		data["users"] = [ { "name": "dl%dxyz" % i, "mail": "", "admin": False } for i in range(users) ]
+		data["nodes"] = [ { "name": "db0nod%d" % i, "status": "ONLINE", "address": { "ip_addr": self.node_url(i), "port": 0 } } for i in range(nodes) ]
+		data["transmitters"] = [ { "name": "db0tx%d" % i, "nodeName": "db0nod%d" % (i % max(nodes, 1)), "deviceType": "RASPPAGER1",
+					   "status": rnd.choice([ "ONLINE", "ONLINE", "OFFLINE", "ERROR" ]) } for i in range(transmitters) ]
+		data["rubrics"] = [ { "number": i + 1, "name": "rubric%d" % i, "label": "Label %d" % i,
+				      "transmitterGroupNames": [ "dl-ni", "dl-all" ] } for i in range(rubrics) ]
+		return data
+
+
+	# set status of a transmitter or node, to simulate changes
+	def status(self, dataset, name, status):
+		with self.lock:
+			for e in self.data[dataset]:
+				if e["name"] == name:
+					e["status"] = status
+
+
+	def handler(self):
+		stub = self
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = "HTTP/1.1"
+
+			def answer(self, code, body):
+				body = json.dumps(body).encode("utf-8")
+				self.send_response(code)
+				self.send_header("Content-Type", "application/json")
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def prepare(self):
+				with stub.lock:
+					stub.requests = stub.requests + 1
+				if stub.latency > 0:
+					time.sleep(stub.latency)
+				if stub.failure > 0 and random.random() < stub.failure:
+					with stub.lock:
+						stub.failed = stub.failed + 1
+					self.answer(500, { "error": "stub failure" })
+					return False
+				return True
+
+			def do_GET(self):
+				if not self.prepare():
+					return
+				path = self.path.strip("/").split("/")[-1]
+				if not path in stub.data:
+					self.answer(404, { "error": "not found" })
+					return
+				with stub.lock:
+					body = json.loads(json.dumps(stub.data[path]))
+				self.answer(200, body)
+
+			def do_POST(self):
+				length = int(self.headers.get("Content-Length", 0))
+				body = json.loads(self.rfile.read(length).decode("utf-8"))
+				if not self.prepare():
+					return
+				with stub.lock:
+					stub.calls.append(body)
+				body["id"] = len(stub.calls)
+				self.answer(201, body)
+
+			def log_message(self, *args):
+				pass
+		return Handler
+
+
+	def start(self):
+		for server in [ self.server ] + self.mirrors:
+			t = threading.Thread(target = server.serve_forever)
+			t.daemon = True
+			t.start()
+		return self
+
+
+	def stop(self):
+		for server in [ self.server ] + self.mirrors:
+			server.shutdown()
+			server.server_close()
+
+
+if __name__ == "__main__":
+	port = 8081
+	if len(sys.argv) > 1:	port = int(sys.argv[1])
+	stub = StubApi(port = port)
+	if len(sys.argv) > 2:	stub.latency = float(sys.argv[2])
+	if len(sys.argv) > 3:	stub.failure = float(sys.argv[3])
+	print("DAPNET stub api on " + stub.url())
+	stub.server.serve_forever()
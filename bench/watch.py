@@ -0,0 +1,65 @@
+# watch alerts: N sessions watch one transmitter, its status is changed
+# in the stub api; every session should get one alert, while the api is
+# polled once per interval for all of them
+#
+# usage: python bench/watch.py [sessions] [interval]
+from __future__ import print_function
+import os
+import shutil
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dapnet
+import peer
+import run
+
+
+def main():
+	sessions = 10
+	interval = 0.5
+	if len(sys.argv) > 1:	sessions = int(sys.argv[1])
+	if len(sys.argv) > 2:	interval = float(sys.argv[2])
+	dapnet.DapNet.watch_interval = interval
+	(stub, node, addr, tmp) = run.start_node(run.options([]))
+	target = stub.data["transmitters"][1]["name"]
+
+	peers = []
+	for i in range(sessions):
+		s = peer.Session(run.NODE_CALL, run.NODE_SSID, addr, "WA%04d" % i)
+		s.connect()
+		s.command("watch transmitter " + target)
+		peers.append(s)
+	# let the poller learn the status
+	time.sleep(2 * interval)
+	requests = stub.requests
+	stub.status("transmitters", target, "CHANGED")
+	start = time.time()
+
+	alerts = 0
+	latency = []
+	for s in peers:
+		try:
+			out = s.prompt()
+		except socket.timeout:
+			continue
+		if "CHANGED" in out:
+			alerts = alerts + 1
+			latency.append(time.time() - start)
+	polls = stub.requests - requests
+	elapsed = time.time() - start
+
+	print("sessions        %d watching %s" % (sessions, target))
+	print("alerts          %d" % alerts)
+	print("alert latency   max %.2f s (interval %.2f s)" % (max(latency or [ 0 ]), interval))
+	print("api requests    %d in %.2f s" % (polls, elapsed))
+	for s in peers:
+		s.command("watch off")
+		s.disconnect()
+	stub.stop()
+	shutil.rmtree(tmp, ignore_errors = True)
+
+
+if __name__ == "__main__":
+	main()
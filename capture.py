@@ -0,0 +1,64 @@
+import socket
+import struct
+import threading
+import time
+
+class Capture:
+
+	"""
+		Capture File
+		============
+
+		|--------------------------------------------------------------|
+		| Magic "AX25UDP1" (8 Byte)                                    |
+		|--------------------------------------------------------------|
+		| Record: Time | Dir | IPv4    | Port | Length | Frame         |
+		|         8 B  | 1 B | 4 B     | 2 B  | 2 B    | Length Bytes  |
+		|--------------------------------------------------------------|
+		| ...                                                          |
+		|--------------------------------------------------------------|
+
+		Time is a little endian double (unix time), Dir is 0 for
+		received and 1 for sent frames, IPv4/Port is the peer.
+		Frames are stored as they are on the wire, including CRC.
+	"""
+
+	MAGIC	= b"AX25UDP1"
+	RECORD	= "<dB4sHH"
+	DIR_RX	= 0
+	DIR_TX	= 1
+
+	def __init__(self, filename, mode = "r"):
+		self.lock = threading.Lock()
+		if mode == "w":
+			self.fd = open(filename, "wb")
+			self.fd.write(self.MAGIC)
+		else:
+			self.fd = open(filename, "rb")
+			if self.fd.read(len(self.MAGIC)) != self.MAGIC:
+				raise ValueError("not an ax25udp capture file: " + filename)
+
+
+	# append frame to capture file
+	def write(self, direction, addr, data, stamp = None):
+		if stamp == None:
+			stamp = time.time()
+		rec = struct.pack(self.RECORD, stamp, direction, socket.inet_aton(addr[0]), addr[1], len(data)) + data
+		with self.lock:
+			self.fd.write(rec)
+			self.fd.flush()
+
+
+	# read all records: (time, direction, addr, frame)
+	def read(self):
+		size = struct.calcsize(self.RECORD)
+		while True:
+			head = self.fd.read(size)
+			if len(head) < size:
+				return
+			(stamp, direction, ip, port, length) = struct.unpack(self.RECORD, head)
+			yield (stamp, direction, (socket.inet_ntoa(ip), port), self.fd.read(length))
+
+
+	def close(self):
+		self.fd.close()
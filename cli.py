@@ -1,6 +1,7 @@
 import dapnetcli
 import sys
 import ax25udp
+import metrics
 
 nodecall = "DB0AAA"
 nodessid = 3
@@ -8,10 +9,43 @@ nodessid = 3
 ax25udp_addr = "127.0.0.1"
 ax25udp_port = 10090
 
+# more udp ports and node calls (call, ssid), served by the same process
+# and sharing one DAPNET api client and cache
+ax25udp_ports = [ ]	# e.g. [ ("127.0.0.1", 10091) ]
+nodecalls = [ ]		# e.g. [ ("DB0AAA", 4) ]
+
+# metrics endpoint (prometheus text on /metrics, json on /json), 0 = disabled
+metrics_addr = "127.0.0.1"
+metrics_port = 0
+
+# share of the transmit arbiter by call or call-ssid, default 1,
+# e.g. a linked node gets more than a user terminal
+tx_weights = { }	# e.g. { "DB0XYZ": 4, "DL1NE-2": 2 }
+
+# regions of pages received as UI frame (connectionless), empty = regions of the cli
+ui_regions = [ ]	# e.g. [ "dl-ni" ]
+
+# callsigns allowed to use the sysop command (profiling), directory of its dumps
+sysops = [ ]		# e.g. [ "DL1NE" ]
+dump_dir = "profiles"	# own directory, files are named profile-<name>.txt
+
+if metrics_port > 0:
+	metrics.registry.serve(metrics_addr, metrics_port)
+
 cli = dapnetcli.DapNetCLI(nodecall, "<dapnet call>", "<dapnet password>")
+cli.sysops = sysops
+if ui_regions:
+	cli.ui_regions = ui_regions
+cli.dump_dir = dump_dir
 cli.udpapi() # start api
 
 ax25 = ax25udp.ax25udp(ax25udp_addr, ax25udp_port, nodecall, nodessid)
+ax25.TX_WEIGHTS = tx_weights
+for (addr, port) in ax25udp_ports:
+	ax25.add_port(addr, port)
+for (call, ssid) in nodecalls:
+	ax25.add_call(call, ssid)
 ax25.banner("DAPNET AX25UDP/PY v0.2, by DL1NE")
-ax25.listen(cli.udphandler)
+cli.push = ax25.push # alerts of watch
+ax25.listen(cli.udphandler, cli.uihandler, cli.closed)
 
@@ -2,9 +2,12 @@ import requests
 from requests.auth import HTTPBasicAuth
 import json
 import os
+import threading
 import time
 from datetime import datetime
 import configparser
+import metrics
+import profiler
 
 class DapNet:
 	api_url = "dapnet.di0han.as64636.de.ampr.org";
@@ -28,12 +31,33 @@ class DapNet:
 	config = configparser.RawConfigParser()
 	config_file = "./dapnet.ini"
 
+	# watched transmitters and nodes, polled by one thread for all watchers
+	watch_interval = 60
+	watch_lists = { "transmitter": "get_transmitterlist", "node": "get_nodelist" }
+
+	# called with (keys, kind, name, old status, new status) on changes
+	alert = None
+
+	metrics = metrics.registry
+	profiler = profiler.registry
+
 	def __init__(self, api_user, api_pass, url = ""):
 		self.api_user = api_user
 		self.api_pass = api_pass
 		if url != "":
 			self.api_url = url
 
+		# api_url, api_prefix, use_alternate_port and dapnet_failure are
+		# changed on failover, by any thread making a request
+		self.failover_lock = threading.Lock()
+		self.dapnet_failure = []
+
+		# (kind, name) -> set of watcher keys, last known status
+		self.watches = {}
+		self.watch_status = {}
+		self.watch_lock = threading.Lock()
+		self.watch_thread = None
+
 		self.callsigns = self.get_userlist()
 		self.nodes_fetch()
 
@@ -45,36 +69,57 @@ class DapNet:
 
 	def makereq(self, json_path, post_data = ""):
 		fail = False
+		start = self.metrics.clock()
+		pstart = self.profiler.clock()
+		with self.failover_lock:
+			used = (self.api_url, self.api_prefix)
 		if post_data == "":
 			self.debugme("API-Request via GET")
-			self.debugme("Query: " + self.api_proto + self.api_url + self.api_prefix + json_path)
+			self.debugme("Query: " + self.api_proto + used[0] + used[1] + json_path)
 			try:
-				res = requests.get(self.api_proto + self.api_url + self.api_prefix + json_path, auth=HTTPBasicAuth(self.api_user, self.api_pass), timeout=self.api_timeout)
+				res = requests.get(self.api_proto + used[0] + used[1] + json_path, auth=HTTPBasicAuth(self.api_user, self.api_pass), timeout=self.api_timeout)
 			except:
 				fail = True
 		else:
 			headers = {'Content-type': 'application/json'}
 			payload = json.dumps(post_data)
 			self.debugme("API-Request via POST")
-			self.debugme("Query: " + self.api_proto + self.api_url + self.api_prefix + json_path)
+			self.debugme("Query: " + self.api_proto + used[0] + used[1] + json_path)
 			self.debugme("JSON : " + payload)
 			try:
-				res = requests.post(self.api_proto + self.api_url + self.api_prefix + json_path, data=payload, headers=headers, auth=HTTPBasicAuth(self.api_user, self.api_pass), timeout=self.api_timeout)
+				res = requests.post(self.api_proto + used[0] + used[1] + json_path, data=payload, headers=headers, auth=HTTPBasicAuth(self.api_user, self.api_pass), timeout=self.api_timeout)
 			except:
 				fail = True
+		if post_data == "":
+			labels = { "endpoint": json_path, "method": "GET" }
+		else:
+			labels = { "endpoint": json_path, "method": "POST" }
+		self.metrics.observe("dapnet_request_seconds", start, labels)
+		self.profiler.spent("api", pstart)
 		if fail or (res.status_code != 200 and res.status_code != 201):
+			self.metrics.inc("dapnet_requests_failed_total", labels)
 			self.debugme("API not reachable, trying another one - if available...")
-			self.dapnet_failure.append(self.api_url)
-			if not self.use_alternate_port:
-				self.api_url = self.api_url + ":" + self.api_alternate_port
-				self.use_alternate_port = True
-				self.api_prefix = "/"
-			else:
-				self.use_alternate_port = False
-				self.api_prefix = "/api/"
-				self.nodes_select()
+			with self.failover_lock:
+				# another thread may have failed over already, then just retry
+				if used == (self.api_url, self.api_prefix):
+					self.metrics.inc("dapnet_failovers_total")
+					self.dapnet_failure.append(self.api_url)
+					# alternate port only for urls without port
+					if not self.use_alternate_port and not ":" in self.api_url:
+						self.api_url = self.api_url + ":" + self.api_alternate_port
+						self.use_alternate_port = True
+						self.api_prefix = "/"
+					else:
+						self.use_alternate_port = False
+						self.api_prefix = "/api/"
+						self.nodes_select()
 			return self.makereq(json_path, post_data)
 		else:
+			self.metrics.inc("dapnet_requests_total", labels)
+			# failed nodes may be used again, after a node answered
+			with self.failover_lock:
+				if len(self.dapnet_failure) > 0:
+					self.dapnet_failure = []
 			return res.json()
 
 
@@ -123,10 +168,12 @@ class DapNet:
 	def page_user(self, callsigns, txt, emergency = False, regions = ""):
 		if regions != "":
 			self.regions = regions
+		else:
+			regions = self.regions
 		data = {}
 		data["text"] = txt
 		data["emergency"] = emergency
-		data["transmitterGroupNames"] = self.regions
+		data["transmitterGroupNames"] = regions
 		calls = []
 		pagecall = []
 		found = False
@@ -163,6 +210,7 @@ class DapNet:
 		with open(self.config_file, 'w') as configfile:
 			self.config.write(configfile)
 
+	# next node, which did not fail yet, called with failover_lock held
 	def nodes_select(self):
 		self.config.read(self.config_file)
 		if 'nodes' in self.config:
@@ -180,6 +228,65 @@ class DapNet:
 		if not found:
 			exit(1)
 
+	# watch status of a transmitter or node, key identifies the watcher
+	def watch(self, kind, name, key):
+		with self.watch_lock:
+			self.watches.setdefault((kind, name.lower()), set()).add(key)
+			if self.watch_thread == None:
+				self.watch_thread = threading.Thread(target = self.poll)
+				self.watch_thread.daemon = True
+				self.watch_thread.start()
+
+	# stop watching, all of key or only one name
+	def unwatch(self, key, name = ""):
+		with self.watch_lock:
+			for target in list(self.watches.keys()):
+				if name != "" and target[1] != name.lower():
+					continue
+				self.watches[target].discard(key)
+				if len(self.watches[target]) < 1:
+					del self.watches[target]
+					self.watch_status.pop(target, None)
+
+	def watching(self, key):
+		with self.watch_lock:
+			return sorted([ target for target in self.watches if key in self.watches[target] ])
+
+
+	# poll watched datasets, until nobody watches anymore
+	def poll(self):
+		while True:
+			with self.watch_lock:
+				if len(self.watches) < 1:
+					self.watch_thread = None
+					return
+			self.poll_once()
+			time.sleep(self.watch_interval)
+
+	# fetch every watched dataset once and report changed status
+	def poll_once(self):
+		with self.watch_lock:
+			targets = dict([ (target, set(keys)) for (target, keys) in self.watches.items() ])
+		for kind in set([ kind for (kind, name) in targets ]):
+			try:
+				data = getattr(self, self.watch_lists[kind])()
+				status = dict([ (e["name"].lower(), e.get("status")) for e in data ])
+			except Exception as e:
+				self.debugme("Polling of " + kind + " failed: " + str(e))
+				continue
+			for ((k, name), keys) in targets.items():
+				if k != kind:
+					continue
+				new = str(status.get(name, "UNKNOWN"))
+				with self.watch_lock:
+					if not (kind, name) in self.watches:
+						continue
+					old = self.watch_status.get((kind, name))
+					self.watch_status[(kind, name)] = new
+				# the first poll only learns the status
+				if old != None and old != new and self.alert != None:
+					self.alert(keys, kind, name, old, new)
+
 	def testing(self):
 		for call in self.get_userlist():
 			print(call)
@@ -1,9 +1,15 @@
 from __future__ import print_function
+import errno
+import itertools
 import json
 import os
+import threading
 import time
+import types
 from datetime import datetime
 import dapnet
+import metrics
+import profiler
 
 class DapNetCLI:
 
@@ -14,6 +20,8 @@ class DapNetCLI:
 
 	my_call = ""
 	user_call = ""
+	# key of the current session, connection id of ax25udp or the user call
+	session = ""
 
 	prompt = ""
 
@@ -22,7 +30,6 @@ class DapNetCLI:
 
 	commands = {	"help":			"Shows this help message" ,
 			"exit":			"Disconnect from this session" ,
-			"quit":			"Disconnect from this session" ,
 			"nodelist": 		"Shows a list of all registeres nodes/cores" ,
 			"userlist": 		"Shows a list of registered users",
 			"transmitterlist":	"Shows a list of registered transmitters",
@@ -30,7 +37,46 @@ class DapNetCLI:
 			"page":			"Sends a message to an user/pager",
 			"sregion":		"Sets the region to transmit",
 			"semergency":		"Sets the emergency mode for calls",
-			"set":			"Shows all running parameters" }
+			"set":			"Shows or changes running parameters",
+			"comp":			"Compressed output for this session (on/off)",
+			"sysop":		"Node maintenance, for sysops only",
+			"watch":		"Alerts on status changes of transmitters/nodes" }
+
+
+	# commands only for callsigns in sysops, hidden for others
+	sysop_commands = [ "sysop" ]
+	sysops = [ ]
+
+	# directory of files written by "sysop dump", only for these files,
+	# named dump_name % name, existing files are never overwritten
+	dump_dir = "profiles"
+	dump_name = "profile-%s.txt"
+
+
+	# alternative names for commands, alias -> command
+	aliases = {	"quit":			"exit" }
+
+
+	# commands with an api call, that run concurrently within a batch:
+	# job_<cmd>() returns the api call, done_<cmd>(result) shows its result
+	jobs = [ "page" ]
+
+	# separator of several commands in one line, max concurrent api calls
+	delimiter = ";"
+	batch_threads = 4
+
+	# commands ending with free text, e.g. the message of page: within
+	# the text the delimiter only separates, if a command follows it
+	texts = [ "page" ]
+
+
+	# minimum count of arguments, help is shown if less given
+	schemas = {	"page":			2,
+			"sregion":		1,
+			"semergency":		1,
+			"comp":			1,
+			"sysop":		1,
+			"watch":		1 }
 
 
 	help_txt = {	"page":			"Sends a message to an user/pager,\n"
@@ -46,8 +92,56 @@ class DapNetCLI:
 					+	"\n"
 					+	"Syntax:\n"
 					+	"sregion <destregion>\n",
+			"set":			"Shows all running parameters,\n"
+					+	"or changes a setting of this session.\n"
+					+	"format csv/json gives list commands as records\n"
+					+	"with a versioned header and without padding.\n"
+					+	"\n"
+					+	"Syntax:\n"
+					+	"set [parameter]\n"
+					+	"set format <text|csv|json>\n",
 			"userlist":		"Syntax:\n"
-					+	"userlist [filter]\n" }
+					+	"userlist [filter]\n",
+			"sysop":		"Sampling profiler of the node and timing of\n"
+					+	"commands (parse, api, render, transmit in ms).\n"
+					+	"\n"
+					+	"Syntax:\n"
+					+	"sysop profile [seconds] - start sampling, default 30\n"
+					+	"sysop stop              - stop sampling\n"
+					+	"sysop show              - show hotspots and timing\n"
+					+	"sysop dump <name>       - write them to a new file on the node\n"
+					+	"sysop reset             - clear all results\n",
+			"watch":		"Sends an alert to this session, when the status\n"
+					+	"of a transmitter or node changes.\n"
+					+	"\n"
+					+	"Syntax:\n"
+					+	"watch transmitter <name>\n"
+					+	"watch node <name>\n"
+					+	"watch list\n"
+					+	"watch off [name]\n",
+			"comp":			"Switches huffman compression of the output,\n"
+					+	"it takes effect after this answer.\n"
+					+	"The code is specific to this node, not //COMP\n"
+					+	"of other node software: your client needs its\n"
+					+	"huffman.py table to decode it. Input stays plain.\n"
+					+	"\n"
+					+	"Syntax:\n"
+					+	"comp <on|off>\n" }
+
+
+	# settings per session, the first value is the default
+	settings = {	"format":		[ "text", "csv", "json" ] }
+
+	# machine readable output of list commands,
+	# command -> (dataset, api call, sort field, version, fields, filter fields)
+	records = {	"nodelist":		("node", "get_nodelist", "name", 1,
+							[ "name", "status" ], [ "name" ]),
+			"userlist":		("user", "get_userlist", "name", 1,
+							[ "name" ], [ "name" ]),
+			"transmitterlist":	("tx", "get_transmitterlist", "name", 1,
+							[ "name", "nodeName", "deviceType", "status" ], [ "name", "nodeName" ]),
+			"rubriclist":		("rubric", "get_rubriclist", "number", 1,
+							[ "number", "name", "label", "transmitterGroupNames" ], [ "name", "number" ]) }
 
 
 	arguments = ""
@@ -59,42 +153,220 @@ class DapNetCLI:
 	list_rubric = {}
 
 	out = ""
+	streams = []
+
+	# session options for ax25udp, returned with the output
+	opts = {}
 
 	page_emergency = False
 
+	# settings of the sessions, session -> { setting: value }
+	sessions = {}
+
 	reqDISC = False
 
+	# sends text to a session, e.g. ax25udp.push
+	push = None
+
+	# answer pages received as UI frame with an UI frame
+	ui_ack = True
+
+	# regions of pages received as UI frame, fixed for the node, sregion of
+	# a session does not change them; empty = default_regions at start
+	ui_regions = [ ]
+
+	metrics = metrics.registry
+	profiler = profiler.registry
+
+	# dispatch tables, built by dispatch_build()
+	handlers = {}
+	dispatch = {}
+
 	def __init__(self, my_call, api_user, api_pass, default_regions = [ "dl-ni" ], api_url = ""):
 		self.api_user = api_user
 		self.api_pass = api_pass
 		self.my_call = my_call
 		self.default_regions = default_regions
+		self.ui_regions = list(self.ui_regions or default_regions)
 		if api_url != "":
 			self.api_url = api_url
-
+		# own copies, so register() does not touch other instances
+		self.commands = dict(self.commands)
+		self.aliases = dict(self.aliases)
+		self.schemas = dict(self.schemas)
+		self.sessions = {}
+		self.handlers = {}
+		for cmd in self.commands:
+			self.handlers[cmd] = getattr(self, "cmd_" + cmd)
+		self.dispatch_build()
+
+
+	# register a new command (or replace an existing one)
+	def register(self, name, handler, txt = "", minargs = 0, aliases = []):
+		self.commands[name] = txt
+		self.handlers[name] = handler
+		if minargs > 0:
+			self.schemas[name] = minargs
+		elif name in self.schemas:
+			del self.schemas[name]
+		for alias in aliases:
+			self.aliases[alias] = name
+		self.dispatch_build()
+
+
+	# precompute all abbreviations, maps prefix -> command,
+	# ambiguous prefixes are mapped to None
+	def dispatch_build(self):
+		names = dict(self.aliases)
+		for cmd in self.commands:
+			names[cmd] = cmd
+		table = {}
+		for name in names:
+			for i in range(1, len(name) + 1):
+				prefix = name[:i]
+				if prefix in table and table[prefix] != names[name]:
+					table[prefix] = None
+				else:
+					table[prefix] = names[name]
+		# full names always win over abbreviations
+		for name in names:
+			table[name] = names[name]
+		self.dispatch = table
+
+
+	# resolve (abbreviated) command, returns command, None if ambiguous
+	# or False if not found
+	def resolve(self, word):
+		return self.dispatch.get(word.lower(), False)
+
+
+	# split line into commands, see delimiter and texts
+	def split(self, input):
+		cmds = []
+		for part in input.split(self.delimiter):
+			words = part.split()
+			if len(cmds) > 0 and self.resolve(cmds[-1].split()[0]) in self.texts and not (words and self.resolve(words[0])):
+				cmds[-1] = cmds[-1] + self.delimiter + part
+			elif part.strip():
+				cmds.append(part)
+		return cmds
 
 	def check_input(self, input):
-		if input == "":
+		cmds = self.split(input)
+		if len(cmds) > 1:
+			self.batch(cmds)
+			return
+		if len(cmds) < 1:
 			return
+		start = self.profiler.clock()
+		func = self.parse(cmds[0])
+		if func:
+			self.profiler.phase(func, "parse", self.profiler.clock() - start)
+			self.execute(func)
+
+
+	# set arguments of command and resolve it, returns None if not runnable
+	def parse(self, input):
 		words = input.split()
+		if len(words) < 1:
+			return None
 		self.arguments = words
 		if len(words)>1:
 			self.argparse = True
 		else:
 			self.argparse = False
-		count = 0
-		func = ""
-		for cmd in self.commands:
-			if words[0] in cmd:
-				count = count + 1
-				func = cmd
-		if count < 1:
+		func = self.resolve(words[0])
+		if func == False:
 			self.msg("Command not found, try help for more information.")
-			return
-		if count > 1:
+			return None
+		if func == None:
 			self.msg("Ambiguous command, try help for more information.")
+			return None
+		if func in self.sysop_commands and not self.sysop():
+			self.msg("Command not found, try help for more information.")
+			return None
+		if len(words) - 1 < self.schemas.get(func, 0):
+			self.help(func)
+			return None
+		# command name for timing of transmission, see ax25udp.conopt
+		if self.profiler.timing:
+			self.opts["cmd"] = func
+		return func
+
+
+	def sysop(self):
+		return self.user_call.upper() in [ call.upper() for call in self.sysops ]
+
+
+	def execute(self, func):
+		start = self.profiler.clock()
+		self.profiler.take("api")
+		if func in self.records and self.option("format") != "text" and self.handlers[func] == getattr(self, "cmd_" + func):
+			res = self.record_list(func)
+		else:
+			res = self.handlers[func]()
+		# generator handlers yield their output line by line, timed by stream
+		if isinstance(res, types.GeneratorType):
+			self.streams.append(self.stream(res, func))
+			return
+		api = self.profiler.take("api")
+		self.profiler.phase(func, "api", api)
+		self.profiler.phase(func, "render", self.profiler.clock() - start - api)
+
+
+	# run several commands of one line, in order, but api calls of jobs
+	# run concurrently; the output is returned in order of the commands
+	def batch(self, cmds):
+		parts = []
+		jobs = []
+		limit = threading.Semaphore(self.batch_threads)
+		def run(job, call):
+			with limit:
+				start = self.profiler.clock()
+				try:
+					job["res"] = call()
+				except Exception as e:
+					job["res"] = "Error: " + str(e)
+				self.profiler.phase(job["func"], "api", self.profiler.clock() - start)
+		for cmd in cmds:
+			self.out = ""
+			self.streams = []
+			start = self.profiler.clock()
+			func = self.parse(cmd)
+			if func:
+				self.profiler.phase(func, "parse", self.profiler.clock() - start)
+			if func in self.jobs and self.handlers[func] == getattr(self, "cmd_" + func):
+				job = { "func": func, "res": None }
+				job["thread"] = threading.Thread(target = run, args = (job, getattr(self, "job_" + func)()))
+				job["thread"].start()
+				jobs.append(job)
+				parts.append(job)
+				continue
+			if func:
+				self.execute(func)
+			parts.append(self.out)
+			parts += self.streams
+			if self.reqDISC:
+				break
+		for job in jobs:
+			job["thread"].join()
+		# collect output
+		out = []
+		for part in parts:
+			if isinstance(part, dict):
+				self.out = ""
+				start = self.profiler.clock()
+				getattr(self, "done_" + part["func"])(part["res"])
+				self.profiler.phase(part["func"], "render", self.profiler.clock() - start)
+				part = self.out
+			out.append(part)
+		# plain text stays a string, so it is sent as short answer
+		self.out = ""
+		self.streams = []
+		if not [ part for part in out if not isinstance(part, str) ]:
+			self.out = "".join(out)
 			return
-		eval("self.cmd_" + func + "()")
+		self.streams = [ itertools.chain(*[ [ part ] if isinstance(part, str) else part for part in out ]) ]
 
 
 	def msg(self, txt, newline = True):
@@ -104,6 +376,42 @@ class DapNetCLI:
 			self.out += '\r'
 
 
+	# session context, restored while a stream is running
+	def context(self):
+		return (self.user_call, self.session, self.arguments, self.argparse)
+
+	def restore(self, ctx):
+		(self.user_call, self.session, self.arguments, self.argparse) = ctx
+
+
+	# run generator handler lazily in the context of its own session,
+	# other sessions (or commands of a batch) may have used the cli in between
+	def stream(self, gen, func = ""):
+		return self.streaming(gen, self.context(), func)
+
+	def streaming(self, gen, ctx, func):
+		spent = 0.0
+		api = 0.0
+		while True:
+			saved = self.context()
+			self.restore(ctx)
+			start = self.profiler.clock()
+			self.profiler.take("api")
+			try:
+				line = next(gen)
+			except StopIteration:
+				line = None
+			finally:
+				self.restore(saved)
+				spent = spent + self.profiler.clock() - start
+				api = api + self.profiler.take("api")
+			if line == None:
+				self.profiler.phase(func, "api", api)
+				self.profiler.phase(func, "render", spent - api)
+				return
+			yield str(line) + '\r'
+
+
 	def pad(self, txtin, flen, left = False, pchar = " "):
 		if txtin == None:		txtin = ""
 		if isinstance(txtin, int):	txtin = str(txtin)
@@ -127,6 +435,53 @@ class DapNetCLI:
 		return tup
 
 
+	# cached dataset from api, fetched and sorted on first use
+	def cache(self, name, fetch, field):
+		if len(getattr(self, "list_" + name)) < 1:
+			self.metrics.inc("dapnet_cache_total", { "dataset": name, "result": "miss" })
+			setattr(self, "list_" + name, self.sortTuple(fetch(), field))
+		else:
+			self.metrics.inc("dapnet_cache_total", { "dataset": name, "result": "hit" })
+		return getattr(self, "list_" + name)
+
+
+	# setting of the current session
+	def option(self, key):
+		return self.sessions.get(self.session, {}).get(key, self.settings[key][0])
+
+
+	# list command as records, one line per entry, fields in fixed order:
+	# csv:  #<command>/<version>,<field>,...  then  value,value,...
+	# json: {"list":<command>,"version":<version>,"fields":[...]}  then  [value,...]
+	def record_list(self, func):
+		(name, fetch, field, version, fields, match) = self.records[func]
+		fmt = self.option("format")
+		if fmt == "json":
+			yield '{"list":' + json.dumps(func) + ',"version":' + str(version) + ',"fields":' + json.dumps(fields, separators = (",", ":")) + '}'
+		else:
+			yield "#" + func + "/" + str(version) + "," + ",".join(fields)
+		for e in self.cache(name, getattr(self.api, fetch), field):
+			if self.argparse and not [ f for f in match if e.get(f) != None and self.arguments[1] in "%s" % e[f] ]:
+				continue
+			row = [ e.get(f) for f in fields ]
+			if fmt == "json":
+				yield json.dumps(row, separators = (",", ":"))
+			else:
+				yield ",".join([ self.csv(v) for v in row ])
+
+
+	def csv(self, v):
+		if v == None:
+			return ""
+		if isinstance(v, list):
+			v = "|".join([ self.csv(e) for e in v ])
+		if not isinstance(v, str):
+			v = ("%s" % v).encode("ascii", "replace")
+		if [ c for c in ',"\r\n' if c in v ]:
+			v = '"' + v.replace('"', '""') + '"'
+		return v
+
+
 	def help(self, topic):
 		if topic in self.help_txt:
 			for line in self.help_txt[topic].split('\n'):
@@ -137,54 +492,50 @@ class DapNetCLI:
 
 
 	def cmd_page(self):
-		if not self.argparse:
-			self.help("page")
-			return
-		if len(self.arguments) < 3:
-			self.help("page")
-			return
+		self.done_page(self.job_page()())
+
+	def job_page(self):
 		destcall = self.arguments[1]
-		message = ' '.join(self.arguments).replace("page " + destcall + " ", "")
+		message = ' '.join(self.arguments).split(" ", 2)[2]
 		message = self.user_call.upper() + ": " + message
-		res = self.api.page_user(destcall, message, self.page_emergency, self.default_regions)
+		emergency = self.page_emergency
+		regions = self.default_regions
+		return lambda: self.api.page_user(destcall, message, emergency, regions)
+
+	def done_page(self, res):
 		self.msg("Result:")
 		self.msg(res)
 
 
 	def cmd_set(self, filter = ""):
+		if filter == "" and self.argparse:
+			filter = self.arguments[1].lower()
+			if len(self.arguments) > 2:
+				if not filter in self.settings or not self.arguments[2].lower() in self.settings[filter]:
+					self.help("set")
+					return
+				self.sessions.setdefault(self.session, {})[filter] = self.arguments[2].lower()
 		self.msg("- SET -")
-		tmp = { "Host Call":		"self.my_call",
-			"User Call":		"self.user_call",
-			"DapNet API Node":	"self.api.get_dapnetnode()",
-			"DapNet API User":	"self.api.get_dapnetuser()",
-			"Regions":		"self.default_regions",
-			"Emergency":		"self.page_emergency" }
-		for e in tmp:
-			if filter != "" and filter not in tmp[e]:
+		tmp = [ ("Host Call",		lambda: self.my_call),
+			("User Call",		lambda: self.user_call),
+			("DapNet API Node",	lambda: self.api.get_dapnetnode()),
+			("DapNet API User",	lambda: self.api.get_dapnetuser()),
+			("Regions",		lambda: self.default_regions),
+			("Emergency",		lambda: self.page_emergency),
+			("Format",		lambda: self.option("format")) ]
+		for (e, v) in tmp:
+			if filter != "" and filter not in e.lower():
 				continue
-			v = eval(tmp[e])
-			self.msg(self.pad(e,18) + str(v))
+			self.msg(self.pad(e,18) + str(v()))
 
 
 	def cmd_sregion(self):
-		if not self.argparse:
-			self.help("sregion")
-			return
-		if len(self.arguments) < 2:
-			self.help("sregion")
-			return
 		region = ' '.join(self.arguments).replace(self.arguments[0] + " ", "").split(" ")
 		self.default_regions = region
 		self.cmd_set("regions")
 
 
 	def cmd_semergency(self):
-		if not self.argparse:
-			self.help("semergency")
-			return
-		if len(self.arguments) < 2:
-			self.help("semergency")
-			return
 		if str(self.arguments[1]).upper() in "TRUE" or str(self.arguments[1]) == "1" or str(self.arguments[1]).upper() in "YES":
 			self.page_emergency = True
 		else:
@@ -192,71 +543,154 @@ class DapNetCLI:
 		self.cmd_set("emergency")
 
 
+	def cmd_comp(self):
+		if str(self.arguments[1]).lower() in [ "on", "1", "yes", "true" ]:
+			self.opts["compress"] = True
+			self.msg("Compression on")
+		else:
+			self.opts["compress"] = False
+			self.msg("Compression off")
+
+
 	def cmd_nodelist(self):
-		self.msg("- NODELIST -")
-		if len(self.list_node) < 1:
-			self.list_node = self.sortTuple(self.api.get_nodelist(), "name")
-		for node in self.list_node:
+		yield "- NODELIST -"
+		for node in self.cache("node", self.api.get_nodelist, "name"):
 			if self.argparse and not self.arguments[1] in node["name"]:
 				continue
-			self.msg(self.pad(node["name"],16) + " Status: " + node["status"])
+			yield self.pad(node["name"],16) + " Status: " + node["status"]
 
 	def cmd_userlist(self):
-		self.msg("- USERLIST -")
-		if len(self.list_user) < 1:
-			self.list_user = self.sortTuple(self.api.get_userlist(), "name")
+		yield "- USERLIST -"
 		count = 0
-		for user in self.list_user:
+		row = ""
+		for user in self.cache("user", self.api.get_userlist, "name"):
 			if self.argparse and not self.arguments[1] in user["name"]:
 				continue
 			if count > 3:
-				self.msg(" ")
+				yield row + " "
+				row = ""
 				count = 0
-			self.msg(self.pad(user["name"], 16), newline = False)
+			row += self.pad(user["name"], 16)
 			count = count + 1
-		self.msg(" ")
+		yield row + " "
 
 
 	def cmd_transmitterlist(self):
-		self.msg("- TRANSMITTERLIST -")
-		if len(self.list_tx) < 1:
-			self.list_tx = self.sortTuple(self.api.get_transmitterlist(), "name")
-		self.msg(self.pad("CALL",6) + " : " + self.pad("NODE",6) + " : " + self.pad("TYPE",24) + " : " + "STATUS")
-		for tx in self.list_tx:
+		yield "- TRANSMITTERLIST -"
+		yield self.pad("CALL",6) + " : " + self.pad("NODE",6) + " : " + self.pad("TYPE",24) + " : " + "STATUS"
+		for tx in self.cache("tx", self.api.get_transmitterlist, "name"):
 			if self.argparse and not self.arguments[1] in tx["name"] and (tx["nodeName"] == None or not self.arguments[1] in tx["nodeName"]):
 				continue
-			self.msg(self.pad(tx["name"],6) + " : " + self.pad(tx["nodeName"],6) + " : " + self.pad(tx["deviceType"],24) + " : " +tx["status"])
+			yield self.pad(tx["name"],6) + " : " + self.pad(tx["nodeName"],6) + " : " + self.pad(tx["deviceType"],24) + " : " +tx["status"]
 
 
 	def cmd_rubriclist(self):
-		self.msg("- RUBRICLIST -")
-		if len(self.list_rubric) < 1:
-			self.list_rubric = self.sortTuple(self.api.get_rubriclist(), "number")
-		self.msg("NR : " + self.pad("NAME",16) + " : " + self.pad("LABEL",14) + " : TRANSMITTERGROUPS")
-		for r in self.list_rubric:
+		yield "- RUBRICLIST -"
+		yield "NR : " + self.pad("NAME",16) + " : " + self.pad("LABEL",14) + " : TRANSMITTERGROUPS"
+		for r in self.cache("rubric", self.api.get_rubriclist, "number"):
 			if self.argparse and not self.arguments[1] in r["name"] and not self.arguments[1] in str(r["number"]):
 				continue
-			self.msg(self.pad(str(r["number"]), 2, left = True, pchar = "0") + " : " + self.pad(r["name"],16) + " : " + self.pad(r["label"],14) + " : " + ','.join(r["transmitterGroupNames"]))
+			yield self.pad(str(r["number"]), 2, left = True, pchar = "0") + " : " + self.pad(r["name"],16) + " : " + self.pad(r["label"],14) + " : " + ','.join(r["transmitterGroupNames"])
 
 
 	def cmd_help(self):
 		self.msg("- HELP -")
-		keylist = self.commands.keys()
-		keylist.sort()
+		keylist = sorted(list(self.commands.keys()) + list(self.aliases.keys()))
 		for key in keylist:
+			if key in self.sysop_commands and not self.sysop():
+				continue
+			if key in self.aliases:
+				self.msg(str(self.pad(key,15)) + " - " + "Same as " + self.aliases[key])
+				continue
 			self.msg(str(self.pad(key,15)) + " - " + str(self.commands[key]))
+		self.msg(" ")
+		self.msg("Several commands can be given in one line, separated by " + self.delimiter)
+
+	def cmd_sysop(self):
+		action = self.arguments[1].lower()
+		if action == "profile":
+			seconds = 30
+			if len(self.arguments) > 2 and self.arguments[2].isdigit():
+				seconds = int(self.arguments[2])
+			self.profiler.start(seconds)
+			self.msg("Profiling for " + str(seconds) + " seconds")
+		elif action == "stop":
+			self.profiler.stop()
+			self.msg("Profiling stopped")
+		elif action == "show":
+			for line in self.profiler.report():
+				self.msg(line)
+		elif action == "dump" and len(self.arguments) > 2:
+			name = "".join([ c for c in self.arguments[2] if c.isalnum() or c in "-_" ])[0:32]
+			if name == "":
+				self.help("sysop")
+				return
+			path = os.path.join(self.dump_dir, self.dump_name % name)
+			if not os.path.isdir(self.dump_dir):
+				os.makedirs(self.dump_dir)
+			try:
+				fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+			except OSError as e:
+				if e.errno != errno.EEXIST:
+					raise
+				self.msg("Exists already: " + path)
+				return
+			with os.fdopen(fd, "w") as f:
+				f.write("\n".join(self.profiler.report()) + "\n")
+			self.msg("Written to " + path)
+		elif action == "reset":
+			self.profiler.reset()
+			self.msg("Profiling results cleared")
+		else:
+			self.help("sysop")
+
+
+	def cmd_watch(self):
+		action = self.arguments[1].lower()
+		if action in self.api.watch_lists and len(self.arguments) > 2:
+			self.api.alert = self.alert
+			self.api.watch(action, self.arguments[2], self.session)
+			self.sessions.setdefault(self.session, {})["watch"] = True
+			self.msg("Watching " + action + " " + self.arguments[2].lower())
+		elif action == "off":
+			if len(self.arguments) > 2:
+				self.api.unwatch(self.session, self.arguments[2])
+			else:
+				self.api.unwatch(self.session)
+			self.msg("Watch removed")
+		elif action == "list":
+			self.msg("- WATCH -")
+			for (kind, name) in self.api.watching(self.session):
+				self.msg(self.pad(kind, 12) + name)
+		else:
+			self.help("watch")
+
+
+	# status change of a watched transmitter/node, from the poller thread
+	def alert(self, sessions, kind, name, old, new):
+		if self.push == None:
+			return
+		for session in sessions:
+			self.push(session, "*** " + kind + " " + name + ": " + old + " -> " + new)
 
-	def cmd_quit(self):
-		self.disconnect()
 
 	def cmd_exit(self):
 		self.disconnect()
 
 	def disconnect(self):
 		self.reqDISC = True
+		self.closed(self.session)
+
+	# session ended, e.g. close_callback of ax25udp: drop its watches and settings
+	def closed(self, session):
+		if session in self.sessions:
+			if self.sessions[session].get("watch"):
+				self.api.unwatch(session)
+			del self.sessions[session]
 
 	def run(self, usercall):
 		self.user_call = usercall
+		self.session = usercall
 		self.prompt = self.user_call + " de " + self.my_call + "> "
 		self.api = dapnet.DapNet(self.api_user, self.api_pass, self.api_url)
 		loop = True
@@ -266,9 +700,46 @@ class DapNetCLI:
 	def udpapi(self):
 		self.api = dapnet.DapNet(self.api_user, self.api_pass, self.api_url)
 
-	def udphandler(self, usercall, txt):
+	# connectionless paging, txt has to be "page <callsign> <message>",
+	# everything else is ignored (beacons etc.)
+	def uihandler(self, usercall, txt):
+		words = txt.split()
+		if len(words) < 3 or words[0].lower() != "page":
+			return ""
+		destcall = words[1]
+		for call in destcall.split(','):
+			if not self.api.check_user(call):
+				self.metrics.inc("dapnet_ui_pages_total", { "result": "rejected" })
+				if self.ui_ack:
+					return "Page rejected, unknown call: " + call
+				return ""
+		message = usercall.upper() + ": " + ' '.join(words).split(" ", 2)[2]
+		res = self.api.page_user(destcall, message, False, self.ui_regions)
+		if not res:
+			self.metrics.inc("dapnet_ui_pages_total", { "result": "failed" })
+			if self.ui_ack:
+				return "Page to " + destcall + " failed"
+			return ""
+		self.metrics.inc("dapnet_ui_pages_total", { "result": "sent" })
+		if self.ui_ack:
+			return "Page to " + destcall + " sent"
+		return ""
+
+	def udphandler(self, usercall, txt, session = None):
 		self.reqDISC = False
 		self.user_call = usercall
+		self.session = session
+		if session == None:
+			self.session = usercall
 		self.out = ""
+		self.streams = []
+		self.opts = {}
 		self.check_input(txt)
-		return (self.reqDISC, str(self.out))
+		out = str(self.out)
+		if len(self.streams) > 0:
+			# output of generator handlers is passed as iterator,
+			# so the first frame can be sent before all lines are ready
+			out = itertools.chain([ out ], *self.streams)
+		if self.opts:
+			return (self.reqDISC, out, self.opts)
+		return (self.reqDISC, out)
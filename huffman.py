@@ -0,0 +1,161 @@
+import heapq
+
+# compressed frame, so the sender can mark it with its own pid
+class Compressed(str):
+	pass
+
+class Huffman:
+
+	"""
+		Compressed Frame
+		================
+
+		|---------------------------------------------|
+		| Length - 1 | Huffman coded text (MSB first) |
+		|---------------------------------------------|
+		| 1 Byte     | up to paclen - 1 Bytes         |
+		|---------------------------------------------|
+
+		or, if the text does not get shorter:
+
+		|---------------------------------------------|
+		| 0xFF       | plain text                     |
+		|---------------------------------------------|
+
+		Every frame is coded on its own with one static table,
+		so frames can be decoded without any state of the link.
+		Text of one frame is limited to 255 characters.
+
+		The table is built from freq below and is specific to this
+		node. It is NOT the code of other packet node software
+		(e.g. //COMP of TheNetNode/Xnet), a peer can only decode the
+		frames with this class and the same freq. Input is never
+		compressed, only output to the user. ax25udp sends the frames
+		with pid L2_PID_COMP instead of 0xF0 (text), so clients without
+		this decoder do not show them as text.
+	"""
+
+	RAW	= 0xFF
+	MAXLEN	= 255
+
+	# relative frequency of characters in node output, all others are 1
+	freq = { " ": 4000, "\r": 400, "\n": 20,
+		 "e": 330, "t": 240, "a": 220, "o": 200, "i": 190, "n": 190, "s": 180, "r": 170,
+		 "h": 120, "l": 110, "d": 100, "c": 80, "u": 70, "m": 60, "f": 50, "p": 50,
+		 "g": 50, "w": 40, "y": 40, "b": 40, "v": 30, "k": 20, "x": 20, "j": 10,
+		 "q": 10, "z": 10,
+		 "E": 60, "T": 60, "A": 60, "O": 60, "I": 50, "N": 60, "S": 60, "R": 50,
+		 "H": 20, "L": 40, "D": 60, "C": 30, "U": 30, "M": 20, "F": 20, "P": 20,
+		 "G": 20, "W": 10, "Y": 10, "B": 40, "V": 10, "K": 10, "X": 10, "J": 5,
+		 "Q": 5, "Z": 5,
+		 "0": 200, "1": 150, "2": 100, "3": 80, "4": 60, "5": 60, "6": 50, "7": 50,
+		 "8": 50, "9": 50,
+		 ":": 150, "-": 150, ".": 80, ",": 60, ">": 30, "<": 10, "/": 20, "(": 10,
+		 ")": 10, "[": 10, "]": 10, "'": 10, "*": 10, "=": 10, "_": 10, "!": 5,
+		 "?": 5, "#": 5, "+": 5, "\"": 5 }
+
+	# code tables, built by table()
+	codes = None
+	lookup = None
+
+	def __init__(self, freq = None):
+		if freq != None:
+			self.freq = freq
+		self.table()
+
+
+	# build canonical codes from frequency table
+	def table(self):
+		heap = [ (self.freq.get(chr(i), 1), i, None) for i in range(256) ]
+		heapq.heapify(heap)
+		nodes = {}
+		count = 256
+		while len(heap) > 1:
+			a = heapq.heappop(heap)
+			b = heapq.heappop(heap)
+			nodes[count] = (a[1], b[1])
+			heapq.heappush(heap, (a[0] + b[0], count, None))
+			count = count + 1
+		# code length of every character
+		lengths = {}
+		stack = [ (heap[0][1], 0) ]
+		while stack:
+			(node, depth) = stack.pop()
+			if node < 256:
+				lengths[node] = max(depth, 1)
+			else:
+				stack.append((nodes[node][0], depth + 1))
+				stack.append((nodes[node][1], depth + 1))
+		# canonical codes: sorted by length, then by character
+		self.codes = {}
+		self.lookup = {}
+		code = 0
+		last = 0
+		for (length, c) in sorted([ (lengths[c], c) for c in lengths ]):
+			code = code << (length - last)
+			last = length
+			self.codes[chr(c)] = (code, length)
+			self.lookup[(length, code)] = chr(c)
+			code = code + 1
+
+
+	# code text without header
+	def encode(self, txt):
+		out = []
+		acc = 0
+		bits = 0
+		for c in txt:
+			(code, length) = self.codes[c]
+			acc = (acc << length) | code
+			bits = bits + length
+			while bits >= 8:
+				bits = bits - 8
+				out.append(chr((acc >> bits) & 0xFF))
+		if bits > 0:
+			out.append(chr((acc << (8 - bits)) & 0xFF))
+		return "".join(out)
+
+
+	# compress text of one frame, with header
+	def compress(self, txt):
+		if not txt:
+			return ""
+		txt = txt[0:self.MAXLEN]
+		data = chr(len(txt) - 1) + self.encode(txt)
+		if len(data) > len(txt):
+			return Compressed(chr(self.RAW) + txt)
+		return Compressed(data)
+
+
+	def decompress(self, data):
+		if len(data) < 1:
+			return ""
+		if ord(data[0]) == self.RAW:
+			return data[1:]
+		count = ord(data[0]) + 1
+		out = []
+		code = 0
+		length = 0
+		for byte in data[1:]:
+			byte = ord(byte)
+			for i in range(7, -1, -1):
+				code = (code << 1) | ((byte >> i) & 1)
+				length = length + 1
+				if (length, code) in self.lookup:
+					out.append(self.lookup[(length, code)])
+					if len(out) >= count:
+						return "".join(out)
+					code = 0
+					length = 0
+		return "".join(out)
+
+
+	# take as much text as fits into one frame of size paclen,
+	# returns (frame, count of characters taken)
+	def frame(self, txt, paclen):
+		n = min(len(txt), self.MAXLEN)
+		data = self.compress(txt[0:n])
+		while len(data) > paclen and n > 1:
+			n = max(1, min(n - 1, n * (paclen - 1) // (len(data) - 1)))
+			data = self.compress(txt[0:n])
+		return (data, n)
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+
+class Metrics:
+
+	# disabled by default, every call returns immediately then
+	enabled = False
+
+	# histogram buckets in seconds
+	buckets = [ 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5 ]
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counters = {}
+		self.gauges = {}
+		self.histograms = {}
+
+
+	def enable(self, enabled = True):
+		self.enabled = enabled
+
+
+	# build key from name and label dict
+	def key(self, name, labels = None):
+		if not labels:
+			return (name, ())
+		return (name, tuple(sorted(labels.items())))
+
+
+	# increase counter
+	def inc(self, name, labels = None, value = 1):
+		if not self.enabled:
+			return
+		k = self.key(name, labels)
+		with self.lock:
+			self.counters[k] = self.counters.get(k, 0) + value
+
+
+	# register gauge, the function is only called on export
+	def gauge(self, name, func, labels = None):
+		self.gauges[self.key(name, labels)] = func
+
+
+	# start time for observe(), 0 if disabled
+	def clock(self):
+		if not self.enabled:
+			return 0
+		return time.time()
+
+
+	# add duration since start to histogram
+	def observe(self, name, start, labels = None):
+		if not self.enabled or not start:
+			return
+		value = time.time() - start
+		k = self.key(name, labels)
+		with self.lock:
+			if not k in self.histograms:
+				self.histograms[k] = [ [0] * len(self.buckets), 0.0, 0 ]
+			h = self.histograms[k]
+			for i in range(len(self.buckets)):
+				if value <= self.buckets[i]:
+					h[0][i] = h[0][i] + 1
+			h[1] = h[1] + value
+			h[2] = h[2] + 1
+
+
+	def labelstr(self, labels, extra = ()):
+		labels = tuple(labels) + tuple(extra)
+		if not labels:
+			return ""
+		return "{" + ",".join([ '%s="%s"' % (k, str(v).replace('"', '\\"')) for (k, v) in labels ]) + "}"
+
+
+	# export as prometheus text format
+	def render(self):
+		out = []
+		with self.lock:
+			for (name, labels) in sorted(self.counters):
+				out.append(name + self.labelstr(labels) + " " + str(self.counters[(name, labels)]))
+			for (name, labels) in sorted(self.histograms):
+				(counts, total, count) = self.histograms[(name, labels)]
+				for i in range(len(self.buckets)):
+					out.append(name + "_bucket" + self.labelstr(labels, [ ("le", self.buckets[i]) ]) + " " + str(counts[i]))
+				out.append(name + "_bucket" + self.labelstr(labels, [ ("le", "+Inf") ]) + " " + str(count))
+				out.append(name + "_sum" + self.labelstr(labels) + " " + repr(total))
+				out.append(name + "_count" + self.labelstr(labels) + " " + str(count))
+		for (name, labels) in sorted(self.gauges):
+			out.append(name + self.labelstr(labels) + " " + str(self.gauges[(name, labels)]()))
+		return "\n".join(out) + "\n"
+
+
+	# export as dict, for json dumps
+	def snapshot(self):
+		res = { "counters": {}, "gauges": {}, "histograms": {} }
+		with self.lock:
+			for (name, labels) in self.counters:
+				res["counters"][name + self.labelstr(labels)] = self.counters[(name, labels)]
+			for (name, labels) in self.histograms:
+				(counts, total, count) = self.histograms[(name, labels)]
+				res["histograms"][name + self.labelstr(labels)] = { "buckets": dict(zip([ str(b) for b in self.buckets ], counts)), "sum": total, "count": count }
+		for (name, labels) in self.gauges:
+			res["gauges"][name + self.labelstr(labels)] = self.gauges[(name, labels)]()
+		return res
+
+
+	# serve /metrics (prometheus text) and /json in a background thread
+	def serve(self, host = "127.0.0.1", port = 9100):
+		metrics = self
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.startswith("/json"):
+					body = json.dumps(metrics.snapshot())
+					ctype = "application/json"
+				else:
+					body = metrics.render()
+					ctype = "text/plain; version=0.0.4"
+				body = body.encode("utf-8")
+				self.send_response(200)
+				self.send_header("Content-Type", ctype)
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+			def log_message(self, *args):
+				pass
+		self.enable()
+		server = HTTPServer((host, port), Handler)
+		t = threading.Thread(target = server.serve_forever)
+		t.daemon = True
+		t.start()
+		return server
+
+
+# shared registry for all classes
+registry = Metrics()
@@ -0,0 +1,137 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+class Profiler:
+
+	# rolling timing of commands (parse, api, render, transmit), always on
+	timing = True
+
+	# last timings kept per command and phase
+	window = 100
+
+	# seconds between two samples of the sampling profiler
+	interval = 0.005
+
+	phases = [ "parse", "api", "render", "transmit" ]
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.times = {}
+		self.local = threading.local()
+		self.samples = {}
+		self.stacks = {}
+		self.count = 0
+		self.thread = None
+		self.until = 0
+
+
+	def clock(self):
+		if not self.timing:
+			return 0
+		return time.time()
+
+
+	# add duration of a phase of a command
+	def phase(self, cmd, name, seconds):
+		if not self.timing:
+			return
+		with self.lock:
+			if not (cmd, name) in self.times:
+				self.times[(cmd, name)] = collections.deque(maxlen = self.window)
+			self.times[(cmd, name)].append(seconds)
+
+
+	# sum up time spent in a phase, e.g. api calls within a command,
+	# collected with take() by the one measuring the command (same thread)
+	def spent(self, name, start):
+		if not self.timing or not start:
+			return
+		account = self.local.__dict__.setdefault("account", {})
+		account[name] = account.get(name, 0.0) + time.time() - start
+
+	def take(self, name):
+		return self.local.__dict__.setdefault("account", {}).pop(name, 0.0)
+
+
+	# start sampling of all threads for some seconds
+	def start(self, seconds = 30):
+		with self.lock:
+			self.until = time.time() + seconds
+			if self.thread != None:
+				return
+			self.samples = {}
+			self.stacks = {}
+			self.count = 0
+			self.thread = threading.Thread(target = self.sample)
+			self.thread.daemon = True
+			self.thread.start()
+
+	def stop(self):
+		with self.lock:
+			self.until = 0
+
+	def running(self):
+		return self.thread != None
+
+
+	def sample(self):
+		me = threading.current_thread().ident
+		while True:
+			frames = sys._current_frames()
+			with self.lock:
+				if time.time() >= self.until:
+					self.thread = None
+					return
+				self.count = self.count + 1
+				for (ident, frame) in frames.items():
+					if ident == me:
+						continue
+					self.samples[self.where(frame)] = self.samples.get(self.where(frame), 0) + 1
+					# every function only once per stack, for recursion
+					seen = set()
+					while frame != None:
+						seen.add(self.where(frame))
+						frame = frame.f_back
+					for func in seen:
+						self.stacks[func] = self.stacks.get(func, 0) + 1
+			time.sleep(self.interval)
+
+
+	def where(self, frame):
+		return os.path.basename(frame.f_code.co_filename) + ":" + frame.f_code.co_name
+
+
+	# report as list of lines: hotspots of the last sampling and timing per command
+	def report(self, top = 10):
+		out = []
+		with self.lock:
+			state = "running" if self.thread != None else "stopped"
+			out.append("Sampling: " + state + ", " + str(self.count) + " samples")
+			if self.count > 0:
+				out.append("Hotspots (self / total):")
+				for (func, n) in sorted(self.samples.items(), key = lambda e: -e[1])[0:top]:
+					out.append("%5.1f%% %5.1f%%  %s" % (100.0 * n / self.count, 100.0 * self.stacks.get(func, 0) / self.count, func))
+			out.append("Timing per command, avg ms (last " + str(self.window) + "):")
+			out.append("%-16s %5s %8s %8s %8s %8s" % tuple([ "command", "n" ] + self.phases))
+			for cmd in sorted(set([ c for (c, p) in self.times ])):
+				row = [ cmd, max([ len(self.times.get((cmd, p), [])) for p in self.phases ]) ]
+				for p in self.phases:
+					t = self.times.get((cmd, p), [])
+					row.append(1000.0 * sum(t) / max(len(t), 1))
+				out.append("%-16s %5d %8.1f %8.1f %8.1f %8.1f" % tuple(row))
+		return out
+
+
+	def reset(self):
+		with self.lock:
+			self.times = {}
+			self.samples = {}
+			self.stacks = {}
+			self.count = 0
+
+
+# shared profiler for all classes
+registry = Profiler()
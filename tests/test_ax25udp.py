@@ -0,0 +1,188 @@
+# checks of the ax25udp link layer without sockets or peer
+#
+# usage: python -m unittest discover tests
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ax25udp
+
+
+class Link(unittest.TestCase):
+
+	def setUp(self):
+		self.ax = ax25udp.ax25udp("127.0.0.1", 0, "DB0AAA", 3)
+
+	# frame from DL1NE to the node, optional via path
+	def frame(self, ctrl, info = None, via = [], call = "DL1NE"):
+		p = self.ax.encode_address("DB0AAA", 3) + self.ax.encode_address(call, 0, final = len(via) < 1)
+		for (n, digi) in enumerate(via):
+			p += self.ax.encode_address(digi, 0, final = n == len(via) - 1, direct = True)
+		p += chr(ctrl)
+		if info != None:
+			p += chr(0xF0) + info
+		return p + self.ax.calc_crc(p)
+
+
+# records frames instead of sending them
+class Sock:
+
+	def __init__(self):
+		self.sent = []
+
+	def sendto(self, packet, addr):
+		self.sent.append(packet)
+
+
+class Xid(Link):
+
+	def test_round_trip(self):
+		params = [ (self.ax.XID_PI_N1_RX, 2, 2048), (self.ax.XID_PI_K_RX, 1, 4), (self.ax.XID_PI_T1, 2, 3000), (self.ax.XID_PI_N2, 1, 10) ]
+		self.assertEqual(self.ax.parseXID(self.ax.encodeXID(params)), dict([ (pi, v) for (pi, pl, v) in params ]))
+
+	def test_malformed(self):
+		self.assertEqual(self.ax.parseXID(""), {})
+		self.assertEqual(self.ax.parseXID("\x00\x00\x00\x00"), {})
+
+	def test_negotiate(self):
+		# xid has no pid, the info follows the control field
+		p = self.frame(0xAF)[0:-2] + self.ax.encodeXID([ (self.ax.XID_PI_N1_RX, 2, 64 * 8), (self.ax.XID_PI_K_RX, 1, 4) ])
+		conid = self.ax.decode(p + self.ax.calc_crc(p), rx = True)
+		answer = self.ax.parseXID(self.ax.negotiate(conid))
+		con = self.ax.connections[conid]
+		self.assertEqual((con["n1"], con["paclen"], con["k"]), (64, 64, 4))
+		self.assertEqual(answer[self.ax.XID_PI_K_RX], 4)
+
+	def test_window(self):
+		conid = self.ax.decode(self.frame(0x3F), rx = True)
+		for (k, window) in [ (-1, 7), (0, 0), (3, 3), (9, 7) ]:
+			self.ax.connections[conid]["k"] = k
+			self.assertEqual(self.ax.window(conid), window)
+
+
+class Ack(Link):
+
+	def setUp(self):
+		Link.setUp(self)
+		self.conid = self.ax.decode(self.frame(0x3F), rx = True)
+		self.con = self.ax.connections[self.conid]
+		self.con["sock"] = Sock()
+
+	# send i frames, so V(S) is tx_seq + n
+	def send(self, n, txt = "x"):
+		for i in range(n):
+			self.ax.send(None, self.conid, self.ax.L2_CTRL_I, txt)
+
+	def test_ack_in_window(self):
+		self.send(3)
+		self.ax.ack(self.conid, 2)
+		self.assertEqual([ seq for (seq, info) in self.con["unacked"] ], [ 2 ])
+		self.ax.ack(self.conid, 3)
+		self.assertEqual(self.con["unacked"], [])
+
+	def test_ack_outside_window(self):
+		self.send(3)
+		for nr in [ 4, 5, 7 ]:
+			self.ax.ack(self.conid, nr)
+			self.assertEqual(len(self.con["unacked"]), 3)
+
+	def test_ack_wraps(self):
+		self.con["tx_seq"] = 6
+		self.send(3)
+		self.ax.ack(self.conid, 5)
+		self.assertEqual(len(self.con["unacked"]), 3)
+		self.ax.ack(self.conid, 0)
+		self.assertEqual([ seq for (seq, info) in self.con["unacked"] ], [ 0 ])
+
+	def test_seven_outstanding(self):
+		self.send(9)
+		self.assertEqual([ seq for (seq, info) in self.con["unacked"] ], [ 2, 3, 4, 5, 6, 7, 0 ])
+
+	def test_paclen(self):
+		n1 = self.con["n1"]
+		self.send(2)
+		self.ax.retransmit(None, self.conid)
+		self.assertEqual(self.con["paclen"], max(self.ax.L2_PACLEN_MIN, n1 // 2))
+		self.assertEqual(len(self.con["sock"].sent), 4)
+		self.ax.retransmit(None, self.conid, 1)
+		self.assertEqual(self.con["paclen"], max(self.ax.L2_PACLEN_MIN, n1 // 4))
+		self.assertEqual(len(self.con["sock"].sent), 5)
+		# grows back after L2_ADAPT_CLEAN acknowledged frames, up to n1
+		for i in range(20):
+			self.send(self.ax.L2_ADAPT_CLEAN)
+			self.ax.ack(self.conid, self.con["tx_seq"])
+		self.assertEqual(self.con["paclen"], n1)
+
+
+class Duplicate(Link):
+
+	def test_i_frame_twice(self):
+		self.assertFalse(self.ax.duplicate(self.frame(0x10, "help\r")))
+		self.assertTrue(self.ax.duplicate(self.frame(0x10, "help\r")))
+		self.assertEqual(self.ax.duplicates, 1)
+
+	def test_digipeated_copy(self):
+		self.assertFalse(self.ax.duplicate(self.frame(0x10, "help\r")))
+		self.assertTrue(self.ax.duplicate(self.frame(0x10, "help\r", via = [ "DB0DIG" ])))
+
+	def test_s_frames_pass(self):
+		self.assertFalse(self.ax.duplicate(self.frame(0x21)))
+		self.assertFalse(self.ax.duplicate(self.frame(0x21)))
+
+	def test_reconnect(self):
+		# connect, first command, disconnect and the same again within DUP_WINDOW
+		for i in range(2):
+			self.assertFalse(self.ax.duplicate(self.frame(0x3F)))
+			self.assertFalse(self.ax.duplicate(self.frame(0x10, "help\r")))
+			self.assertFalse(self.ax.duplicate(self.frame(0x53)))
+		self.assertEqual(self.ax.duplicates, 0)
+
+	def test_ui_twice(self):
+		self.assertFalse(self.ax.duplicate(self.frame(0x03, "page dl2xyz hi")))
+		self.assertTrue(self.ax.duplicate(self.frame(0x03, "page dl2xyz hi")))
+
+	def test_other_call(self):
+		self.assertFalse(self.ax.duplicate(self.frame(0x10, "help\r")))
+		self.assertFalse(self.ax.duplicate(self.frame(0x10, "help\r", call = "DL2XYZ")))
+
+	def test_truncated(self):
+		self.assertFalse(self.ax.duplicate(self.frame(0x10, "help\r")[0:17]))
+
+
+class Output(Link):
+
+	def setUp(self):
+		Link.setUp(self)
+		self.conid = (("DB0AAA", 3), ("DL1NE", 0))
+		self.ax.conmk(self.conid)
+		self.ax.connections[self.conid].update({ "src_call": "DL1NE", "dst_call": "DB0AAA", "dst_ssid": 3 })
+
+	# all frames of the pending output, without prompt
+	def drain(self):
+		con = self.ax.connections[self.conid]
+		out = ""
+		while not con["prompt"]:
+			self.ax.pull(None, self.conid)
+			out += "".join(con["tx_queue"])
+			con["tx_queue"] = []
+		return out[0:-len("DL1NE de DB0AAA-3> ")]
+
+	def test_pushed_text_capped(self):
+		self.ax.CON_TX_MAX = 4096
+		for i in range(100):
+			self.ax.output(self.conid, "x" * 999 + "\r")
+		self.assertTrue(self.ax.connections[self.conid]["tx_queued"] <= 4096 + len(self.ax.CON_TX_SHED))
+		out = self.drain()
+		self.assertEqual(len(out), 4096 + len(self.ax.CON_TX_SHED))
+		self.assertTrue(out.endswith(self.ax.CON_TX_SHED))
+		self.assertEqual(self.ax.connections[self.conid]["tx_queued"], 0)
+
+	def test_below_cap(self):
+		self.ax.output(self.conid, "hello\r")
+		self.ax.output(self.conid, iter([ "a\r", "b\r" ]))
+		self.assertEqual(self.drain(), "hello\ra\rb\r")
+
+
+if __name__ == "__main__":
+	unittest.main()
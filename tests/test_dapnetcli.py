@@ -0,0 +1,105 @@
+# checks of DapNetCLI without network, the api is replaced by a recorder
+#
+# usage: python -m unittest discover tests
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dapnetcli
+
+
+class RecordApi:
+
+	def __init__(self):
+		self.pages = []
+
+	def page_user(self, destcall, message, emergency, regions):
+		self.pages.append((destcall, message))
+		self.regions = regions
+		return { "id": len(self.pages) }
+
+	def check_user(self, call):
+		return True
+
+
+class CheckInput(unittest.TestCase):
+
+	def setUp(self):
+		self.cli = dapnetcli.DapNetCLI("DB0AAA", "", "")
+		self.cli.api = RecordApi()
+
+	def test_page_text_with_delimiter(self):
+		out = self.cli.udphandler("DL1NE", "page dl2xyz meet at 5; bring food")[1]
+		self.assertEqual(self.cli.api.pages, [ ("dl2xyz", "DL1NE: meet at 5; bring food") ])
+		self.assertFalse("Command not found" in out)
+
+	def test_batch_page_text_with_delimiter(self):
+		out = self.cli.udphandler("DL1NE", "page dl2xyz meet at 5; bring food;page dl3xyz ok;help")[1]
+		self.assertEqual(sorted(self.cli.api.pages), [ ("dl2xyz", "DL1NE: meet at 5; bring food"), ("dl3xyz", "DL1NE: ok") ])
+		self.assertFalse("Command not found" in out)
+		self.assertTrue("- HELP -" in out)
+
+	def test_split(self):
+		self.assertEqual(self.cli.split("help;set"), [ "help", "set" ])
+		self.assertEqual(self.cli.split("page a x;y;help"), [ "page a x;y", "help" ])
+		self.assertEqual(self.cli.split("set; ;"), [ "set" ])
+
+
+class Dispatch(unittest.TestCase):
+
+	def setUp(self):
+		self.cli = dapnetcli.DapNetCLI("DB0AAA", "", "")
+
+	# resolve by scanning all names, as check_input did before the table
+	def scan(self, word):
+		names = dict(self.cli.aliases)
+		for cmd in self.cli.commands:
+			names[cmd] = cmd
+		if word in names:
+			return names[word]
+		found = set([ names[name] for name in names if name.startswith(word) ])
+		if len(found) < 1:
+			return False
+		if len(found) > 1:
+			return None
+		return found.pop()
+
+	def test_table_matches_scan(self):
+		words = set([ "x", "zz", "userlistx" ])
+		for name in list(self.cli.commands) + list(self.cli.aliases):
+			for i in range(1, len(name) + 1):
+				words.add(name[:i])
+		for word in words:
+			self.assertEqual(self.cli.resolve(word), self.scan(word), word)
+
+	def test_examples(self):
+		self.assertEqual(self.cli.resolve("u"), "userlist")
+		self.assertEqual(self.cli.resolve("USER"), "userlist")
+		self.assertEqual(self.cli.resolve("set"), "set")
+		self.assertEqual(self.cli.resolve("s"), None)
+		self.assertEqual(self.cli.resolve("q"), "exit")
+		self.assertEqual(self.cli.resolve("nope"), False)
+
+	def test_register(self):
+		other = dapnetcli.DapNetCLI("DB0AAA", "", "")
+		self.cli.register("uptime", lambda: self.cli.msg("up"), "Shows uptime", aliases = [ "up" ])
+		self.assertEqual(self.cli.resolve("up"), "uptime")
+		self.assertEqual(self.cli.resolve("u"), None)
+		self.assertEqual(other.resolve("u"), "userlist")
+		self.assertEqual(self.cli.udphandler("DL1NE", "uptime")[1].split("\r")[0], "up")
+
+
+class UiPage(unittest.TestCase):
+
+	def test_regions_fixed(self):
+		cli = dapnetcli.DapNetCLI("DB0AAA", "", "", default_regions = [ "dl-ni" ])
+		cli.api = RecordApi()
+		cli.udphandler("DL1NE", "sregion dl-by")
+		cli.uihandler("DL2XYZ", "page dl1ne hi")
+		self.assertEqual(cli.api.pages, [ ("dl1ne", "DL2XYZ: hi") ])
+		self.assertEqual(cli.api.regions, [ "dl-ni" ])
+
+
+if __name__ == "__main__":
+	unittest.main()
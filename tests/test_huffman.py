@@ -0,0 +1,54 @@
+# checks of the static huffman code of compressed output
+#
+# usage: python -m unittest discover tests
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import huffman
+
+
+class RoundTrip(unittest.TestCase):
+
+	def setUp(self):
+		self.codec = huffman.Huffman()
+
+	def test_text(self):
+		txt = "db0tx1          ONLINE     RASPPAGER1\r"
+		data = self.codec.compress(txt)
+		self.assertTrue(isinstance(data, huffman.Compressed))
+		self.assertTrue(len(data) < len(txt))
+		self.assertEqual(self.codec.decompress(data), txt)
+
+	def test_all_characters(self):
+		txt = "".join([ chr(i) for i in range(256) ])
+		for n in [ 1, 7, 64, 255 ]:
+			self.assertEqual(self.codec.decompress(self.codec.compress(txt[0:n])), txt[0:n])
+
+	def test_raw(self):
+		# rare characters get longer, sent as plain text
+		txt = "\x00\x01\x02\x03"
+		data = self.codec.compress(txt)
+		self.assertEqual(ord(data[0]), self.codec.RAW)
+		self.assertEqual(self.codec.decompress(data), txt)
+
+	def test_empty(self):
+		self.assertEqual(self.codec.compress(""), "")
+		self.assertEqual(self.codec.decompress(""), "")
+
+	def test_frame(self):
+		txt = "DL1NE de DB0AAA-3> " * 40
+		for paclen in [ 32, 64, 256 ]:
+			out = ""
+			rest = txt
+			while rest:
+				(data, n) = self.codec.frame(rest, paclen)
+				self.assertTrue(len(data) <= paclen)
+				out += self.codec.decompress(data)
+				rest = rest[n:]
+			self.assertEqual(out, txt)
+
+
+if __name__ == "__main__":
+	unittest.main()